@@ -1,3 +1,4 @@
+import os
 import bcrypt
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
@@ -8,13 +9,39 @@ SECRET_KEY = "super-secret-key-change-this-in-production"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# bcrypt work factor for new hashes. Defaults to the library's 12; tests and local dev can
+# lower it via BCRYPT_ROUNDS for faster sign-ups. Existing hashes keep verifying either way,
+# since checkpw reads the cost from the stored hash.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+# Built once rather than per token
+JWT_HEADERS = {"alg": ALGORITHM, "typ": "JWT"}
+JWT_ALGORITHMS = [ALGORITHM]
+
 def verify_password(plain_password, hashed_password):
     # bcrypt.checkpw expects bytes. DB stores hash as string.
     return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
 
 def get_password_hash(password):
     # bcrypt.hashpw returns bytes, we decode to store as string in DB
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode('utf-8')
+
+# Checked against when the username doesn't exist, so a miss costs the same bcrypt
+# work as a wrong password and response timing doesn't reveal which usernames exist.
+# The check must run at the cost the stored hashes use (which may predate BCRYPT_ROUNDS),
+# so there is one dummy hash per cost, made on first use.
+DUMMY_PASSWORD_HASHES = {}
+
+def get_dummy_password_hash(rounds):
+    if rounds not in DUMMY_PASSWORD_HASHES:
+        DUMMY_PASSWORD_HASHES[rounds] = bcrypt.hashpw(b"not-a-real-password", bcrypt.gensalt(rounds=rounds)).decode('utf-8')
+    return DUMMY_PASSWORD_HASHES[rounds]
+
+def verify_password_or_dummy(plain_password, hashed_password=None, dummy_rounds=BCRYPT_ROUNDS):
+    if hashed_password is None:
+        verify_password(plain_password, get_dummy_password_hash(dummy_rounds))
+        return False
+    return verify_password(plain_password, hashed_password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -23,12 +50,12 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM, headers=JWT_HEADERS)
     return encoded_jwt
 
 def decode_access_token(token: str):
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(token, SECRET_KEY, algorithms=JWT_ALGORITHMS)
         return payload
     except JWTError:
         return None
@@ -49,6 +49,13 @@ CREATE TABLE IF NOT EXISTS fact_daily_visits (
     FOREIGN KEY (date_key) REFERENCES dim_date(date_key)
 );
 
+-- Geocoding (Nominatim) responses, kept so hospital search stays warm across restarts
+CREATE TABLE IF NOT EXISTS nominatim_cache (
+    query TEXT PRIMARY KEY,
+    response TEXT NOT NULL, -- JSON as returned by Nominatim
+    fetched_at REAL NOT NULL -- Unix time
+);
+
 -- Indexes for performance
 
 
@@ -79,6 +86,58 @@ CREATE TABLE IF NOT EXISTS patients (
     FOREIGN KEY(hospital_id) REFERENCES dim_hospital(hospital_id)
 );
 
+-- Per-hospital daily patient/flu counts, kept in step with patients by the triggers below so
+-- the miners read O(hospitals x days) rows instead of aggregating every patient per run
+CREATE TABLE IF NOT EXISTS agg_patient_daily_flu (
+    hospital_id TEXT NOT NULL,
+    admission_date DATE NOT NULL,
+    patient_count INTEGER NOT NULL DEFAULT 0,
+    flu_positive_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (hospital_id, admission_date)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS trg_patients_agg_insert AFTER INSERT ON patients
+BEGIN
+    INSERT INTO agg_patient_daily_flu (hospital_id, admission_date, patient_count, flu_positive_count)
+    VALUES (NEW.hospital_id, NEW.admission_date, 1, COALESCE(NEW.is_flu_positive, 0))
+    ON CONFLICT(hospital_id, admission_date) DO UPDATE SET
+        patient_count = patient_count + 1,
+        flu_positive_count = flu_positive_count + excluded.flu_positive_count;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_patients_agg_delete AFTER DELETE ON patients
+BEGIN
+    UPDATE agg_patient_daily_flu
+    SET patient_count = patient_count - 1,
+        flu_positive_count = flu_positive_count - COALESCE(OLD.is_flu_positive, 0)
+    WHERE hospital_id = OLD.hospital_id AND admission_date = OLD.admission_date;
+    -- A day with no patients left has no row, as in a GROUP BY over patients
+    DELETE FROM agg_patient_daily_flu
+    WHERE hospital_id = OLD.hospital_id AND admission_date = OLD.admission_date AND patient_count <= 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_patients_agg_update AFTER UPDATE OF hospital_id, admission_date, is_flu_positive ON patients
+BEGIN
+    UPDATE agg_patient_daily_flu
+    SET patient_count = patient_count - 1,
+        flu_positive_count = flu_positive_count - COALESCE(OLD.is_flu_positive, 0)
+    WHERE hospital_id = OLD.hospital_id AND admission_date = OLD.admission_date;
+    DELETE FROM agg_patient_daily_flu
+    WHERE hospital_id = OLD.hospital_id AND admission_date = OLD.admission_date AND patient_count <= 0;
+    INSERT INTO agg_patient_daily_flu (hospital_id, admission_date, patient_count, flu_positive_count)
+    VALUES (NEW.hospital_id, NEW.admission_date, 1, COALESCE(NEW.is_flu_positive, 0))
+    ON CONFLICT(hospital_id, admission_date) DO UPDATE SET
+        patient_count = patient_count + 1,
+        flu_positive_count = flu_positive_count + excluded.flu_positive_count;
+END;
+
+-- Backfill for databases that had patients before the table existed (no-op once populated)
+INSERT INTO agg_patient_daily_flu (hospital_id, admission_date, patient_count, flu_positive_count)
+SELECT hospital_id, admission_date, COUNT(*), COALESCE(SUM(is_flu_positive), 0)
+FROM patients
+WHERE NOT EXISTS (SELECT 1 FROM agg_patient_daily_flu)
+GROUP BY hospital_id, admission_date;
+
 -- Active Alerts System
 CREATE TABLE IF NOT EXISTS alerts (
     alert_id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -121,7 +180,50 @@ CREATE TABLE IF NOT EXISTS api_keys (
 );
 
 -- Indexes for performance (Moved to end to ensure tables exist)
-CREATE INDEX IF NOT EXISTS idx_patients_hospital_date ON patients(hospital_id, admission_date);
-CREATE INDEX IF NOT EXISTS idx_patients_flu ON patients(is_flu_positive);
+-- Covering index for the per-hospital daily flu aggregate the miner runs: the GROUP BY is
+-- answered from the index alone, reading just these three columns instead of full rows.
+-- It supersedes the (hospital_id, admission_date) prefix index.
+DROP INDEX IF EXISTS idx_patients_hospital_date;
+CREATE INDEX IF NOT EXISTS idx_patients_agg ON patients(hospital_id, admission_date, is_flu_positive);
+-- Flu-positive rows in a date window (history map, alert checks) as a covering range scan;
+-- replaces the single-column is_flu_positive index, which is its prefix.
+DROP INDEX IF EXISTS idx_patients_flu;
+CREATE INDEX IF NOT EXISTS idx_patients_flu_date ON patients(is_flu_positive, admission_date, hospital_id);
+-- One fact row per hospital per day; the unique index is the ERP upsert's conflict target
+-- and replaces the plain lookup index on the same columns.
+-- Older warehouses may hold several rows for the same hospital/day: fold them into the
+-- earliest row first (counts summed, bed/ICU/vent snapshots take the highest reading)
+-- so the unique index can always be built. No-ops once the index exists.
+UPDATE fact_daily_visits AS f SET
+    total_visits = d.total_visits,
+    flu_positive_count = d.flu_positive_count,
+    resp_syndrome_count = d.resp_syndrome_count,
+    ili_syndrome_count = d.ili_syndrome_count,
+    beds_in_use = d.beds_in_use,
+    icu_in_use = d.icu_in_use,
+    vents_in_use = d.vents_in_use
+FROM (
+    SELECT MIN(visit_id) AS keep_id,
+           SUM(total_visits) AS total_visits,
+           SUM(flu_positive_count) AS flu_positive_count,
+           SUM(resp_syndrome_count) AS resp_syndrome_count,
+           SUM(ili_syndrome_count) AS ili_syndrome_count,
+           MAX(beds_in_use) AS beds_in_use,
+           MAX(icu_in_use) AS icu_in_use,
+           MAX(vents_in_use) AS vents_in_use
+    FROM fact_daily_visits
+    GROUP BY hospital_key, date_key
+    HAVING COUNT(*) > 1
+) AS d
+WHERE f.visit_id = d.keep_id;
+DELETE FROM fact_daily_visits
+WHERE visit_id NOT IN (SELECT MIN(visit_id) FROM fact_daily_visits GROUP BY hospital_key, date_key);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_visits_hospital_date ON fact_daily_visits(hospital_key, date_key);
+DROP INDEX IF EXISTS idx_visits_hospital_date;
+-- Recent-window reads of the daily flu table (alerts); covering with the primary key columns
+CREATE INDEX IF NOT EXISTS idx_agg_daily_flu_date ON agg_patient_daily_flu(admission_date, flu_positive_count);
+CREATE INDEX IF NOT EXISTS idx_alerts_created ON alerts(created_at); -- Daily alert de-dupe
+CREATE INDEX IF NOT EXISTS idx_reports_ip_created ON community_reports(ip_hash, created_at); -- Spam velocity check
+CREATE INDEX IF NOT EXISTS idx_api_keys_hospital ON api_keys(hospital_id, is_active, created_at); -- Latest active key
 
 
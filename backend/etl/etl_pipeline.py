@@ -17,39 +17,39 @@ def init_db():
     conn.close()
     print("Database initialized.")
 
-def generate_hospitals(n=30):
+def generate_hospitals(n=30, rng=None):
     """Generate synthetic hospital data."""
+    rng = rng if rng is not None else np.random.default_rng()
     # Ontario-ish coordinates approx range: Lat 42-50, Lon -85 to -74
-    hospitals = []
     regions = ['Southern', 'Eastern', 'Northern', 'Western', 'Central']
+    ids = np.arange(n)
     
-    for i in range(n):
-        hospitals.append({
-            'hospital_id': f'H{i:03d}',
-            'name': f'General Hospital {i}',
-            'latitude': np.random.uniform(43.0, 48.0),
-            'longitude': np.random.uniform(-82.0, -76.0),
-            'region': np.random.choice(regions),
-            'city': f'City_{i}',
-            # Synthetic Capacity
-            'total_beds': np.random.randint(50, 500),
-            'icu_beds': 0, # calculated below
-            'ventilators': 0 # calculated below
-        })
-        
-        # Logic: ~10-20% of beds are ICU, ~50% of ICU have Vents
-        hospitals[-1]['icu_beds'] = int(hospitals[-1]['total_beds'] * np.random.uniform(0.1, 0.2))
-        hospitals[-1]['ventilators'] = int(hospitals[-1]['icu_beds'] * np.random.uniform(0.4, 0.6))
-    return pd.DataFrame(hospitals)
+    # Synthetic Capacity, drawn for all hospitals at once
+    total_beds = rng.integers(50, 500, size=n)
+    # Logic: ~10-20% of beds are ICU, ~50% of ICU have Vents
+    icu_beds = (total_beds * rng.uniform(0.1, 0.2, size=n)).astype(int)
+    ventilators = (icu_beds * rng.uniform(0.4, 0.6, size=n)).astype(int)
+    
+    return pd.DataFrame({
+        'hospital_id': [f'H{i:03d}' for i in ids],
+        'name': [f'General Hospital {i}' for i in ids],
+        'latitude': rng.uniform(43.0, 48.0, size=n),
+        'longitude': rng.uniform(-82.0, -76.0, size=n),
+        'region': rng.choice(regions, size=n),
+        'city': [f'City_{i}' for i in ids],
+        'total_beds': total_beds,
+        'icu_beds': icu_beds,
+        'ventilators': ventilators
+    })
 
 def generate_outbreak_pattern(length):
     """Generate a bell-curve like outbreak pattern."""
     x = np.linspace(-3, 3, length)
     return np.exp(-x**2)
 
-def generate_daily_visits(hospitals_df, days=60):
+def generate_daily_visits(hospitals_df, days=60, rng=None):
     """Generate synthetic daily visits with outbreak patterns."""
-    visits = []
+    rng = rng if rng is not None else np.random.default_rng()
     # End date is today, start date is 'days' ago
     end_date = datetime.now()
     start_date = end_date - timedelta(days=days)
@@ -58,92 +58,123 @@ def generate_daily_visits(hospitals_df, days=60):
     # Simulate a few outbreaks
     outbreak_starts = [300, 650] # Days when outbreaks start (approx Winter)
     
-    for _, hospital in hospitals_df.iterrows():
-        # Base baseline visits
-        base_visits = np.random.randint(50, 150)
-        
-        # Each hospital has a slightly different lag for the outbreak
-        hospital_lag = np.random.randint(-10, 10) 
-        
-        for i, date in enumerate(dates):
-            day_of_year = date.timetuple().tm_yday
-            
-            # Seasonality (higher in winter)
-            seasonality = 10 * np.cos(2 * np.pi * (day_of_year - 15) / 365)
-            
-            # Outbreak signal
-            outbreak_signal = 0
-            for start in outbreak_starts:
-                t = i - start - hospital_lag
-                if 0 <= t < 60: # Outbreak lasts ~60 days
-                    # Bell curve shape
-                    outbreak_signal += 50 * np.exp(-((t - 30)**2) / 200)
-            
-            total_visits = int(max(0, base_visits + seasonality + np.random.normal(0, 10)))
-            flu_positive = int(max(0, (total_visits * 0.05) + outbreak_signal + np.random.normal(0, 2)))
-            
-            # Ensure logical consistency
-            flu_positive = min(flu_positive, total_visits)
-            
-            visits.append({
-                'hospital_id': hospital['hospital_id'],
-                'date': date,
-                'total_visits': total_visits,
-                'flu_positive_count': flu_positive,
-                'resp_syndrome_count': int(flu_positive * 1.2), # Correlated
-                'ili_syndrome_count': flu_positive,
-                
-                # Resource Usage Logic
-                # ~15% of Flu cases need Bed, ~5% need ICU, ~2% need Vent
-                # Plus baseline non-flu usage (~60-80% of capacity)
-                'beds_in_use': int(hospital['total_beds'] * np.random.uniform(0.6, 0.85)) + int(flu_positive * 0.15),
-                'icu_in_use': int(hospital['icu_beds'] * np.random.uniform(0.5, 0.7)) + int(flu_positive * 0.05),
-                'vents_in_use': int(hospital['ventilators'] * np.random.uniform(0.3, 0.5)) + int(flu_positive * 0.02)
-            })
-            
-    return pd.DataFrame(visits)
+    # Every series is computed as a (hospital, day) array in one broadcast pass
+    n_hospitals = len(hospitals_df)
+    shape = (n_hospitals, days)
+    day_index = np.arange(days)
+    day_of_year = np.array([date.timetuple().tm_yday for date in dates])
+    
+    # Base baseline visits
+    base_visits = rng.integers(50, 150, size=n_hospitals)[:, np.newaxis]
+    
+    # Each hospital has a slightly different lag for the outbreak
+    hospital_lag = rng.integers(-10, 10, size=n_hospitals)[:, np.newaxis]
+    
+    # Seasonality (higher in winter)
+    seasonality = 10 * np.cos(2 * np.pi * (day_of_year - 15) / 365)
+    
+    # Outbreak signal
+    # Outbreak lasts ~60 days, bell curve shape. The curve only depends on the integer day
+    # offset, so it is tabulated once and gathered, instead of evaluating exp over the grid.
+    outbreak_curve = 50 * np.exp(-((np.arange(60) - 30)**2) / 200)
+    outbreak_signal = np.zeros(shape)
+    for start in outbreak_starts:
+        t = day_index - start - hospital_lag
+        active = (t >= 0) & (t < 60)
+        outbreak_signal[active] += outbreak_curve[t[active]]
+    
+    total_visits = np.maximum(0, base_visits + seasonality + rng.normal(0, 10, shape)).astype(int)
+    flu_positive = np.maximum(0, (total_visits * 0.05) + outbreak_signal + rng.normal(0, 2, shape)).astype(int)
+    
+    # Ensure logical consistency
+    flu_positive = np.minimum(flu_positive, total_visits)
+    
+    # Resource Usage Logic
+    # ~15% of Flu cases need Bed, ~5% need ICU, ~2% need Vent
+    # Plus baseline non-flu usage (~60-80% of capacity)
+    total_beds = hospitals_df['total_beds'].to_numpy()[:, np.newaxis]
+    icu_beds = hospitals_df['icu_beds'].to_numpy()[:, np.newaxis]
+    ventilators = hospitals_df['ventilators'].to_numpy()[:, np.newaxis]
+    beds_in_use = (total_beds * rng.uniform(0.6, 0.85, shape)).astype(int) + (flu_positive * 0.15).astype(int)
+    icu_in_use = (icu_beds * rng.uniform(0.5, 0.7, shape)).astype(int) + (flu_positive * 0.05).astype(int)
+    vents_in_use = (ventilators * rng.uniform(0.3, 0.5, shape)).astype(int) + (flu_positive * 0.02).astype(int)
+    
+    # Flatten hospital-major (all days of the first hospital, then the next, ...)
+    date_index = pd.DatetimeIndex(dates)
+    return pd.DataFrame({
+        'hospital_id': np.repeat(hospitals_df['hospital_id'].to_numpy(), days),
+        'date': np.tile(date_index, n_hospitals),
+        'date_key': np.tile(date_key(date_index), n_hospitals),
+        'total_visits': total_visits.ravel(),
+        'flu_positive_count': flu_positive.ravel(),
+        'resp_syndrome_count': (flu_positive * 1.2).astype(int).ravel(), # Correlated
+        'ili_syndrome_count': flu_positive.ravel(),
+        'beds_in_use': beds_in_use.ravel(),
+        'icu_in_use': icu_in_use.ravel(),
+        'vents_in_use': vents_in_use.ravel()
+    })
+
+# Season of each month, indexed by month number (index 0 unused)
+SEASON_BY_MONTH = np.array(['', 'Winter', 'Winter', 'Spring', 'Spring', 'Spring', 'Summer',
+                            'Summer', 'Summer', 'Fall', 'Fall', 'Fall', 'Winter'])
+
+def date_key(dates):
+    """YYYYMMDD integer keys for datetime-like values, by arithmetic instead of strftime."""
+    return dates.year * 10000 + dates.month * 100 + dates.day
+
+def insert_frame(conn, table, df):
+    """
+    Append a DataFrame's rows through one executemany directly on the pipeline's connection,
+    skipping pandas' SQL layer (table reflection, dtype mapping, per-chunk statements).
+    Datetime columns are stored as text, as to_sql did.
+    """
+    datetime_columns = df.select_dtypes('datetime').columns
+    if len(datetime_columns):
+        df = df.assign(**{col: df[col].astype(str) for col in datetime_columns})
+    conn.executemany(
+        f"INSERT INTO {table} ({', '.join(df.columns)}) VALUES ({', '.join(['?'] * len(df.columns))})",
+        df.itertuples(index=False, name=None)
+    )
 
 def load_dims(conn, hospitals_df, visits_df):
     """Load Dimension tables."""
     # Load Hospitals
-    hospitals_df.to_sql('dim_hospital', conn, if_exists='append', index=False)
+    insert_frame(conn, 'dim_hospital', hospitals_df)
     
     # Load Dates
     unique_dates = pd.to_datetime(visits_df['date'].unique())
     dates_df = pd.DataFrame({
         'full_date': unique_dates,
-        'date_key': unique_dates.strftime('%Y%m%d').astype(int),
+        'date_key': date_key(unique_dates),
         'year': unique_dates.year,
         'month': unique_dates.month,
         'day_of_week': unique_dates.dayofweek,
         'is_weekend': unique_dates.dayofweek >= 5,
-        'season': pd.Series(unique_dates.month).map(lambda m: 'Winter' if m in [12, 1, 2] else 'Spring' if m in [3, 4, 5] else 'Summer' if m in [6, 7, 8] else 'Fall')
+        'season': SEASON_BY_MONTH[np.asarray(unique_dates.month)]
     })
-    dates_df.to_sql('dim_date', conn, if_exists='append', index=False)
+    insert_frame(conn, 'dim_date', dates_df)
     
     return dates_df
 
-def load_facts(conn, visits_df, dates_df, hospitals_df):
+def load_facts(conn, visits_df):
     """Load Fact table."""
-    # Map foreign keys
-    hospital_map = pd.read_sql("SELECT hospital_id, hospital_key FROM dim_hospital", conn)
-    date_map = pd.read_sql("SELECT full_date, date_key FROM dim_date", conn)
-    
-    # Convert dates to string for merging if needed, or ensure types match
-    visits_df['date'] = pd.to_datetime(visits_df['date'])
-    date_map['full_date'] = pd.to_datetime(date_map['full_date'])
+    # Map foreign keys. date_key already comes with the generated visits (same arithmetic as
+    # dim_date), so only the autoincrement hospital_key has to be looked up.
+    # A plain dict from the cursor is enough for H rows; Series.map then assigns the column
+    # without building a DataFrame or merging.
+    hospital_map = dict(conn.execute("SELECT hospital_id, hospital_key FROM dim_hospital").fetchall())
     
-    merged = visits_df.merge(hospital_map, on='hospital_id').merge(date_map, left_on='date', right_on='full_date')
+    facts = visits_df.assign(hospital_key=visits_df['hospital_id'].map(hospital_map))
     
-    facts = merged[['hospital_key', 'date_key', 'total_visits', 'flu_positive_count', 'resp_syndrome_count', 'ili_syndrome_count', 'beds_in_use', 'icu_in_use', 'vents_in_use']]
-    facts.to_sql('fact_daily_visits', conn, if_exists='append', index=False)
+    fact_columns = ['hospital_key', 'date_key', 'total_visits', 'flu_positive_count', 'resp_syndrome_count', 'ili_syndrome_count', 'beds_in_use', 'icu_in_use', 'vents_in_use']
+    insert_frame(conn, 'fact_daily_visits', facts[fact_columns])
 
-def load_patients(conn, visits_df):
+def load_patients(conn, visits_df, rng=None):
     """
     Populate the 'patients' table with synthetic individual records based on daily visits.
     This ensures the 'Live Stats' and 'Clustering' (which query 'patients') have data to work with.
     """
-    patients = []
+    rng = rng if rng is not None else np.random.default_rng()
     # Optimization: Only generate patients for the last 30 days to save time/space for this demo
     cutoff_date = pd.Timestamp.now() - pd.Timedelta(days=30)
     
@@ -152,69 +183,81 @@ def load_patients(conn, visits_df):
     
     print(f"Generating patient details for {len(recent_visits)} days of data...")
     
-    for _, row in recent_visits.iterrows():
-        # Get integer hospital ID if possible, but schema accepts integer FK.
-        # Our generate_hospitals uses 'H000' strings. 
-        # API Keys mock uses 1,2,3.
-        # Let's simple query dim_hospital to get the PK for 'H000'
-        # For bulk load, we'll assume the same mapping logic: 1-based index if inserted in order
-        # Actually, let's look up the ID.
-        h_id_str = row['hospital_id']
-        # Extract number H001 -> 2 (0-indexed loop + 1?)
-        # safer to query map.
-        pass
-    
-    # Faster approach: Get Map
-    for _, row in recent_visits.iterrows():
-        # Use the TEXT hospital_id directly as per schema (patients.hospital_id is TEXT)
-        h_pk = row['hospital_id']
-        if not h_pk: continue
-        
-        # Generate N patients for 'total_visits'
-        count = row['total_visits']
-        flu_count = row['flu_positive_count']
-        
-        for i in range(count):
-            is_flu = 1 if i < flu_count else 0
-            
-            p = {
-                'hospital_id': h_pk,
-                'admission_date': row['date'].strftime('%Y-%m-%d'),
-                'age': np.random.randint(5, 90),
-                'gender': np.random.choice(['M', 'F']),
-                'is_flu_positive': is_flu,
-                'symptoms': 'Fever, Cough' if is_flu else 'None'
-            }
-            patients.append(p)
-            
-    if patients:
-        pdf = pd.DataFrame(patients)
-        pdf.to_sql('patients', conn, if_exists='append', index=False)
-        print(f"Loaded {len(patients)} synthetic patients.")
+    # Use the TEXT hospital_id directly as per schema (patients.hospital_id is TEXT)
+    hospital_ids = recent_visits['hospital_id']
+    recent_visits = recent_visits[hospital_ids.notna() & (hospital_ids != '')]
+    
+    # Generate N patients for 'total_visits' of each visit row, all rows at once:
+    # every per-row value is repeated total_visits times, and the first
+    # flu_positive_count patients of each row are the flu-positive ones.
+    counts = recent_visits['total_visits'].to_numpy()
+    n_patients = int(counts.sum())
+    if n_patients == 0:
+        return
+    
+    row_start = np.repeat(np.cumsum(counts) - counts, counts)
+    is_flu = (np.arange(n_patients) - row_start) < np.repeat(recent_visits['flu_positive_count'].to_numpy(), counts)
+    
+    patients = zip(
+        np.repeat(recent_visits['hospital_id'].to_numpy(), counts).tolist(),
+        np.repeat(recent_visits['date'].dt.strftime('%Y-%m-%d').to_numpy(), counts).tolist(),
+        rng.integers(5, 90, size=n_patients).tolist(),
+        rng.choice(['M', 'F'], size=n_patients).tolist(),
+        is_flu.astype(int).tolist(),
+        np.where(is_flu, 'Fever, Cough', 'None').tolist()
+    )
+    
+    # One executemany in the pipeline's open transaction (committed once in run_pipeline)
+    conn.executemany("""
+        INSERT INTO patients (hospital_id, admission_date, age, gender, is_flu_positive, symptoms)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, patients)
+    print(f"Loaded {n_patients} synthetic patients.")
 
-def run_pipeline():
+def run_pipeline(seed=42):
     print("Generating synthetic data...")
-    hosp_df = generate_hospitals()
-    visits_df = generate_daily_visits(hosp_df, days=30)
+    # One seeded Generator shared by every stage, so a given seed reproduces the same warehouse
+    rng = np.random.default_rng(seed)
+    hosp_df = generate_hospitals(rng=rng)
+    visits_df = generate_daily_visits(hosp_df, days=30, rng=rng)
     
     print("Loading Data Warehouse...")
     init_db()
     conn = sqlite3.connect(DB_PATH)
     
+    # The patients triggers maintain agg_patient_daily_flu row by row. For the bulk reload they
+    # are set aside and the table is rebuilt in one grouped pass afterwards. sqlite3 does not
+    # open a transaction for DDL by itself, so BEGIN explicitly: the drops, the reload and the
+    # re-created triggers commit together, and a failure before commit() rolls all of it back.
+    conn.execute("BEGIN")
+    patient_triggers = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'patients'").fetchall()
+    for name, _ in patient_triggers:
+        conn.execute(f"DROP TRIGGER {name}")
+    
     # Clear existing data for clean run
     conn.execute("DELETE FROM fact_daily_visits")
     conn.execute("DELETE FROM patients")
+    conn.execute("DELETE FROM agg_patient_daily_flu")
     conn.execute("DELETE FROM dim_hospital")
     conn.execute("DELETE FROM dim_date")
     
     print("Loading Dimensions...")
-    dates_df = load_dims(conn, hosp_df, visits_df)
+    load_dims(conn, hosp_df, visits_df)
     
     print("Loading Facts...")
-    load_facts(conn, visits_df, dates_df, hosp_df)
+    load_facts(conn, visits_df)
     
     print("Loading Patients (Granular Data)...")
-    load_patients(conn, visits_df)
+    load_patients(conn, visits_df, rng=rng)
+    
+    conn.execute("""
+        INSERT INTO agg_patient_daily_flu (hospital_id, admission_date, patient_count, flu_positive_count)
+        SELECT hospital_id, admission_date, COUNT(*), COALESCE(SUM(is_flu_positive), 0)
+        FROM patients
+        GROUP BY hospital_id, admission_date
+    """)
+    for _, sql in patient_triggers:
+        conn.execute(sql)
     
     # Generate API Keys for Testing
     print("Generating API Keys...")
@@ -228,10 +271,10 @@ def run_pipeline():
     # But generate_hospitals makes 'H000'. 
     # Let's just insert assuming the IDs are 1, 2, 3 based on autoincrement order of insertion
     secrets = ["HOSP_001_SECRET", "HOSP_002_SECRET", "HOSP_003_SECRET"]
-    for i, secret in enumerate(secrets):
-        # We need actual hospital_keys from dim_table. 
-        # But for simplicity in this mock, let's just assume IDs 1, 2, 3 exist.
-        conn.execute("INSERT OR IGNORE INTO api_keys (hospital_id, api_secret) VALUES (?, ?)", (i+1, secret))
+    # We need actual hospital_keys from dim_table. 
+    # But for simplicity in this mock, let's just assume IDs 1, 2, 3 exist.
+    conn.executemany("INSERT OR IGNORE INTO api_keys (hospital_id, api_secret) VALUES (?, ?)",
+                     [(i + 1, secret) for i, secret in enumerate(secrets)])
 
     conn.commit()
     conn.close()
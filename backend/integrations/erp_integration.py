@@ -1,116 +1,246 @@
+import atexit
 import hashlib
+import logging
+import queue
 import sqlite3
-from datetime import datetime
+import threading
+import time
+from datetime import date, datetime
+
+# Diagnostics go through logging (handlers/levels are the app's concern) rather than
+# synchronous writes to ad-hoc log files on the ingestion path
+logger = logging.getLogger(__name__)
+
+# (db_path, hospital_pk) -> (hospital_key, hospital_id). Hospitals are never re-keyed while
+# the API runs, so resolved identities are memoized; misses are not cached so hospitals
+# registered later still resolve on first use.
+HOSPITAL_RESOLUTION_CACHE = {
+    'entries': {},
+    'max_entries': 1024
+}
+
+# Admission events are written by a background flusher in batches: whatever arrives within
+# the interval (up to the batch size) goes to SQLite in one transaction
+ERP_FLUSH_INTERVAL = 0.2 # seconds
+ERP_BATCH_SIZE = 1000
 
 class ERPIntegration:
     def __init__(self, db_path="warehouse.db"):
         self.db_path = db_path
+        # One long-lived connection per integrator instead of opening one per call;
+        # the lock serializes its use across request threads
+        self._conn = None
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self._flusher.start()
+        # Don't drop queued events on interpreter shutdown
+        atexit.register(self.flush)
 
     def get_db_connection(self):
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        return conn
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            # Applied once per connection: WAL lets dashboard reads proceed during ingestion,
+            # and NORMAL sync is durable under WAL without an fsync on every commit
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute("PRAGMA synchronous=NORMAL;")
+            self._conn = conn
+        return self._conn
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
 
     def validate_api_key(self, api_key: str):
         """
         Checks if the API key exists and is active.
         Returns hospital_id if valid, None otherwise.
         """
-        conn = self.get_db_connection()
+        self._lock.acquire()
         try:
+            conn = self.get_db_connection()
             row = conn.execute("SELECT hospital_id FROM api_keys WHERE api_secret = ? AND is_active = 1", (api_key,)).fetchone()
             if row:
                 return row['hospital_id']
             return None
         finally:
-            conn.close()
+            self._lock.release()
+
+    def _resolve_hospital(self, hospital_pk):
+        """
+        Resolve hospital_pk (integer key or "H001"-style string) to
+        (hospital_key, hospital_id), or (None, None) if it is unknown.
+        """
+        # We need:
+        # - real_hospital_pk (int) for fact_daily_visits
+        # - hospital_text_id (str) for patients table
+        cache_key = (self.db_path, hospital_pk)
+        resolved = HOSPITAL_RESOLUTION_CACHE['entries'].get(cache_key)
+        if resolved:
+            return resolved
+
+        self._lock.acquire()
+        try:
+            conn = self.get_db_connection()
+            # Match by Integer Key or String ID in one lookup, preferring the key match
+            row = conn.execute("""
+                SELECT hospital_key, hospital_id FROM dim_hospital
+                WHERE hospital_key = ? OR hospital_id = ?
+                ORDER BY hospital_key = ? DESC
+                LIMIT 1
+            """, (hospital_pk, hospital_pk, hospital_pk)).fetchone()
+        finally:
+            self._lock.release()
+
+        if not row:
+            return None, None
+        entries = HOSPITAL_RESOLUTION_CACHE['entries']
+        if len(entries) >= HOSPITAL_RESOLUTION_CACHE['max_entries']:
+            entries.clear()
+        entries[cache_key] = (row['hospital_key'], row['hospital_id'])
+        return entries[cache_key]
 
     def process_admission_event(self, hospital_pk: int, payload: dict):
         """
         Ingests a JSON payload representing a patient event.
         hospital_pk: The integer primary key of the hospital.
+        The event is resolved and normalized here, then queued for the batch writer;
+        returns False if it cannot be ingested (e.g. unknown hospital).
+        """
+        return self.process_admission_events(hospital_pk, [payload])[0]
+
+    def process_admission_events(self, hospital_pk: int, payloads: list):
         """
-        conn = self.get_db_connection()
+        Batch form of process_admission_event: the hospital is resolved once and every
+        payload validated and queued for the batch writer. Returns one ingested flag per
+        payload (False for payloads rejected by validation).
+        """
+        logger.debug("processing %d event(s) for %s", len(payloads), hospital_pk)
         try:
-            with open("d:/Disease_Outbreak_Detection/debug_error_ABS.log", "a") as f:
-                f.write(f"processing event for {hospital_pk}\n")
+            real_hospital_pk, hospital_text_id = self._resolve_hospital(hospital_pk)
+        except Exception as e:
+            logger.exception(f"Ingestion Error: {e}")
+            return [False] * len(payloads)
 
-            # 0. Resolve Hospital Identity (Handle if PK is int or "H001" string)
-            # We need:
-            # - real_hospital_pk (int) for fact_daily_visits
-            # - hospital_text_id (str) for patients table
-            
-            real_hospital_pk = None
-            hospital_text_id = None
-            
-            # Try finding by Integer Key
-            row_by_key = conn.execute("SELECT hospital_key, hospital_id FROM dim_hospital WHERE hospital_key = ?", (hospital_pk,)).fetchone()
-            if row_by_key:
-                real_hospital_pk = row_by_key['hospital_key']
-                hospital_text_id = row_by_key['hospital_id']
+        if not real_hospital_pk or not hospital_text_id:
+            msg = f"Ingestion Error: Could not resolve hospital for key '{hospital_pk}'. real_pk={real_hospital_pk}, text_id={hospital_text_id}"
+            logger.error(msg)
+            return [False] * len(payloads)
+
+        results = []
+        for payload in payloads:
+            try:
+                self._queue.put(self._build_event(real_hospital_pk, hospital_text_id, payload))
+                results.append(True)
+            except ValueError as e:
+                # Bad input is rejected here, while the caller can still be told, rather than
+                # failing later in the background writer where it could only be logged
+                logger.warning(f"Rejected admission event: {e}")
+                results.append(False)
+            except Exception as e:
+                logger.exception(f"Ingestion Error: {e}")
+                results.append(False)
+        return results
+
+    def _build_event(self, real_hospital_pk, hospital_text_id, payload):
+        # 1. Patients row
+        is_flu = 1 if payload.get('diagnosis') == 'FLU_POS' else 0
+        # Today's date is only formatted when the payload doesn't carry one
+        adm_date_str = payload['admission_date'] if 'admission_date' in payload else datetime.now().strftime('%Y-%m-%d')
+        # patients.admission_date is NOT NULL and the miners parse it as a date string
+        if not isinstance(adm_date_str, str) or not adm_date_str:
+            raise ValueError(f"admission_date must be a YYYY-MM-DD string, got {adm_date_str!r}")
+
+        # 2. Daily Visits Fact key
+        # Convert date to key YYYYMMDD: the usual YYYY-MM-DD wire format by slicing once it is
+        # known to be a real calendar day, anything else through strptime (stored normalized).
+        # Unparseable dates are rejected: stored as-is they would break the miners' date parsing.
+        is_iso = len(adm_date_str) == 10 and adm_date_str[4] == '-' and adm_date_str[7] == '-'
+        digits = adm_date_str[:4] + adm_date_str[5:7] + adm_date_str[8:] if is_iso else ''
+        try:
+            if digits.isdigit():
+                date(int(digits[:4]), int(digits[4:6]), int(digits[6:])) # e.g. 2026-02-30 raises
+                date_key = int(digits)
             else:
-                # Try finding by String ID
-                row_by_id = conn.execute("SELECT hospital_key, hospital_id FROM dim_hospital WHERE hospital_id = ?", (hospital_pk,)).fetchone()
-                if row_by_id:
-                     real_hospital_pk = row_by_id['hospital_key']
-                     hospital_text_id = row_by_id['hospital_id']
-            
-            if not real_hospital_pk or not hospital_text_id:
-                msg = f"Ingestion Error: Could not resolve hospital for key '{hospital_pk}'. real_pk={real_hospital_pk}, text_id={hospital_text_id}"
-                print(msg)
-                with open("debug_error.log", "w") as f:
-                    f.write(msg)
-                return False
-
-            # 1. Insert into Patients table
-            is_flu = 1 if payload.get('diagnosis') == 'FLU_POS' else 0
-            adm_date_str = payload.get('admission_date', datetime.now().strftime('%Y-%m-%d'))
-            
-            conn.execute("""
+                dt = datetime.strptime(adm_date_str, '%Y-%m-%d')
+                date_key = dt.year * 10000 + dt.month * 100 + dt.day
+                adm_date_str = dt.strftime('%Y-%m-%d')
+        except ValueError:
+            raise ValueError(f"admission_date is not a valid YYYY-MM-DD date: {adm_date_str!r}")
+
+        patient = (
+            hospital_text_id,
+            adm_date_str,
+            payload.get('age'),
+            payload.get('gender', 'U'),
+            is_flu,
+            payload.get('symptoms', '')
+        )
+
+        return (patient, real_hospital_pk, date_key, is_flu)
+
+    def flush(self):
+        """Block until every queued event has been written."""
+        self._queue.join()
+
+    def _flush_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            # Gather whatever else arrives within the interval, up to the batch size
+            deadline = time.monotonic() + ERP_FLUSH_INTERVAL
+            while len(batch) < ERP_BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                if not self._write_events(batch):
+                    # One bad event shouldn't cost the rest of the batch: retry them one by one
+                    for event in batch:
+                        self._write_events([event])
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write_events(self, events):
+        """Insert the events' patients and fold them into the daily fact rows in one transaction."""
+        # Per (hospital, day) totals, so each fact row is upserted once per batch
+        visit_counts = {}
+        for _, hospital_key, date_key, is_flu in events:
+            counts = visit_counts.setdefault((hospital_key, date_key), [0, 0])
+            counts[0] += 1
+            counts[1] += is_flu
+        
+        self._lock.acquire()
+        try:
+            conn = self.get_db_connection()
+            conn.executemany("""
                 INSERT INTO patients (hospital_id, admission_date, age, gender, is_flu_positive, symptoms)
                 VALUES (?, ?, ?, ?, ?, ?)
-            """, (
-                hospital_text_id,
-                adm_date_str,
-                payload.get('age'),
-                payload.get('gender', 'U'),
-                is_flu,
-                payload.get('symptoms', '')
-            ))
-
-            # 2. Update Daily Visits Fact Table
-            # Convert date to key YYYYMMDD
-            try:
-                dt = datetime.strptime(adm_date_str, '%Y-%m-%d')
-                date_key = int(dt.strftime('%Y%m%d'))
-            except:
-                date_key = int(datetime.now().strftime('%Y%m%d'))
-
-            # Check if row exists
-            existing = conn.execute("""
-                SELECT visit_id, total_visits, flu_positive_count 
-                FROM fact_daily_visits 
-                WHERE hospital_key = ? AND date_key = ?
-            """, (real_hospital_pk, date_key)).fetchone()
-            
-            if existing:
-                new_total = existing['total_visits'] + 1
-                new_flu = existing['flu_positive_count'] + is_flu
-                conn.execute("UPDATE fact_daily_visits SET total_visits = ?, flu_positive_count = ? WHERE visit_id = ?", 
-                             (new_total, new_flu, existing['visit_id']))
-            else:
-                conn.execute("""
-                    INSERT INTO fact_daily_visits (hospital_key, date_key, total_visits, flu_positive_count, beds_in_use)
-                    VALUES (?, ?, 1, ?, 50) 
-                """, (real_hospital_pk, date_key, is_flu))
+            """, [event[0] for event in events])
+
+            # Increment the day's counters, creating the row on first admission. A single upsert
+            # (conflict target: uq_visits_hospital_date) instead of SELECT then UPDATE/INSERT.
+            conn.executemany("""
+                INSERT INTO fact_daily_visits (hospital_key, date_key, total_visits, flu_positive_count, beds_in_use)
+                VALUES (?, ?, ?, ?, 50)
+                ON CONFLICT(hospital_key, date_key) DO UPDATE SET
+                    total_visits = total_visits + excluded.total_visits,
+                    flu_positive_count = flu_positive_count + excluded.flu_positive_count
+            """, [(hospital_key, date_key, total, flu) for (hospital_key, date_key), (total, flu) in visit_counts.items()])
             
             conn.commit()
             return True
         except Exception as e:
-            print(f"Ingestion Error: {e}")
-            with open("debug_error.log", "w") as f:
-                import traceback
-                traceback.print_exc(file=f)
+            # Leave the shared connection clean for the next batch
+            if self._conn is not None:
+                self._conn.rollback()
+            logger.exception(f"Ingestion Error: {e}")
             return False
         finally:
-            conn.close()
+            self._lock.release()
@@ -1,18 +1,34 @@
 from fastapi import FastAPI, HTTPException, Depends, status, File, UploadFile, Request, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 import sqlite3
+import asyncio
+import anyio
+import queue
+import threading
 import hashlib
+import bisect
+import time
+import itertools
+import operator
 import pandas as pd
+import numpy as np
 import os
-from datetime import timedelta
-from fastapi.responses import FileResponse, Response
+from datetime import date, timedelta
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+import orjson
 
 from mining.mining_engine import OutbreakMiner
 import auth
 
-app = FastAPI(title="Disease Outbreak Detection API")
+class ORJSONResponse(JSONResponse):
+    """JSON responses encoded with orjson (numpy scalars/arrays included) instead of stdlib json."""
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+
+app = FastAPI(title="Disease Outbreak Detection API", default_response_class=ORJSONResponse)
 
 # Allow CORS for Frontend (even if served statically, good for dev)
 app.add_middleware(
@@ -28,6 +44,10 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_PATH = os.path.join(BASE_DIR, "database/warehouse.db")
 STATIC_DIR = os.path.join(os.path.dirname(BASE_DIR), "frontend/out")
 
+# System stress bands for the public risk level (upper bounds are exclusive of the next level)
+RISK_THRESHOLDS = (0.5, 0.8)
+RISK_LEVELS = ("NOMINAL", "ELEVATED", "CRITICAL")
+
 # Models source of truth
 class UserRegister(BaseModel):
     username: str
@@ -44,16 +64,143 @@ class Token(BaseModel):
     token_type: str
     role: str
 
+# Handlers are plain `def`s run on AnyIO's worker threads (40 by default). sqlite3 releases the
+# GIL while a statement runs, so a larger pool keeps quick endpoints from queueing behind slow ones.
+WORKER_THREADS = int(os.getenv("WORKER_THREADS", "100"))
+
+@app.on_event("startup")
+async def configure_worker_threads():
+    anyio.to_thread.current_default_thread_limiter().total_tokens = WORKER_THREADS
+
+# Idle connections kept open for reuse, so requests skip the per-call connect/close.
+# Connections move between worker threads, hence check_same_thread=False.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+DB_POOL = queue.LifoQueue(maxsize=DB_POOL_SIZE)
+
+# Applied once per new connection (journal_mode persists in the file; the rest are
+# per-connection): WAL with NORMAL sync avoids an fsync per commit, temp b-trees for
+# GROUP BY/ORDER BY stay in memory, and reads go through a 256 MB mmap and a 64 MB page cache.
+DB_CONNECTION_PRAGMAS = """
+PRAGMA journal_mode=WAL;
+PRAGMA synchronous=NORMAL;
+PRAGMA temp_store=MEMORY;
+PRAGMA mmap_size=268435456;
+PRAGMA cache_size=-65536;
+"""
+
 def get_db_connection():
     try:
-        conn = sqlite3.connect(DB_PATH, timeout=10)
-        conn.execute("PRAGMA journal_mode=WAL;")
+        return DB_POOL.get_nowait()
+    except queue.Empty:
+        pass
+    try:
+        conn = sqlite3.connect(DB_PATH, timeout=10, check_same_thread=False)
+        conn.executescript(DB_CONNECTION_PRAGMAS)
         conn.row_factory = sqlite3.Row
         return conn
     except Exception as e:
         print(f"Database connection error: {e}")
         raise HTTPException(status_code=500, detail="Database connection failed")
 
+def release_db_connection(conn):
+    """Hand a connection back to the pool; uncommitted work is rolled back, as close() would."""
+    if conn.in_transaction:
+        conn.rollback()
+    try:
+        DB_POOL.put_nowait(conn)
+    except queue.Full:
+        conn.close()
+
+# Lookups shared by many handlers. sqlite3 caches prepared statements per connection keyed
+# on the SQL text, so with pooled connections these compile once per connection and are
+# reused across requests; one constant keeps every call site on the identical text.
+SQL_USER_HOSPITAL = "SELECT hospital_id FROM users WHERE username = ?"
+SQL_HOSPITAL_ID_BY_KEY = "SELECT hospital_id FROM dim_hospital WHERE hospital_key = ?"
+
+# The same resolution as a scalar subquery, for handlers that only need the admin's hospital
+# inside their own statement (one round trip instead of two or three). The first takes
+# users.hospital_id as the text id; the second treats it as a hospital_key. Both fall back
+# to 'H000' like the Python-side lookups.
+SQL_USER_HOSPITAL_SUBQUERY = "COALESCE(NULLIF(NULLIF((SELECT hospital_id FROM users WHERE username = ?), ''), 0), 'H000')"
+SQL_USER_HOSPITAL_BY_KEY_SUBQUERY = """COALESCE((
+    SELECT h.hospital_id FROM users u JOIN dim_hospital h ON h.hospital_key = u.hospital_id
+    WHERE u.username = ?
+), 'H000')"""
+
+def fetch_df(conn, sql, params=()):
+    """Run a query straight into a DataFrame from the cursor, without pd.read_sql's wrapper overhead."""
+    cur = conn.execute(sql, params)
+    return pd.DataFrame.from_records(cur.fetchall(), columns=[d[0] for d in cur.description])
+
+# dim_hospital changes at ETL / sign-up cadence, not per request, so the projected frame
+# is memoized. It is keyed on the dim_hospital part of get_data_version(), so an ETL run or
+# sign-up from another process is picked up on the next call and the version-keyed mining
+# caches are never built from a stale frame. In-place edits (profile updates) don't move that
+# fingerprint: writers in this process reset it via invalidate_hospitals_cache(), and the TTL
+# bounds how long other processes' edits take to show.
+HOSPITALS_CACHE = {
+    'entry': None, # (dim_hospital fingerprint, fetched_at, frame), replaced as one tuple
+    'ttl': 60 # 1 minute
+}
+
+SQL_HOSPITALS_VERSION = "SELECT MAX(hospital_key), COUNT(*) FROM dim_hospital"
+
+def get_hospitals_df(conn):
+    """Hospitals projected to the columns the miner and cluster responses actually use (shared, read-only)."""
+    current_time = time.monotonic()
+    version = tuple(conn.execute(SQL_HOSPITALS_VERSION).fetchone())
+    entry = HOSPITALS_CACHE['entry']
+    if entry is None or entry[0] != version or current_time - entry[1] >= HOSPITALS_CACHE['ttl']:
+        frame = fetch_df(conn, "SELECT hospital_key, hospital_id, name, latitude, longitude FROM dim_hospital")
+        entry = HOSPITALS_CACHE['entry'] = (version, current_time, frame)
+    return entry[2]
+
+def invalidate_hospitals_cache():
+    HOSPITALS_CACHE['entry'] = None
+
+# The spatial distance matrix depends only on hospital coordinates, so it is reused for as long
+# as get_hospitals_df hands out the same frame. Stored as one (frame, matrix) tuple so readers
+# never pair a frame with another frame's matrix.
+SPATIAL_DISTANCE_CACHE = {
+    'entry': None
+}
+
+def get_distance_matrix(miner, hospitals_df, metric):
+    # Temporal metrics depend on the visit series, so only the spatial matrix is reusable
+    if metric != 'spatial':
+        return miner.compute_distance_matrix(metric=metric)
+    entry = SPATIAL_DISTANCE_CACHE['entry']
+    if entry is None or entry[0] is not hospitals_df:
+        dist_matrix = miner.compute_distance_matrix(metric='spatial')
+        dist_matrix.setflags(write=False) # Shared across requests
+        entry = SPATIAL_DISTANCE_CACHE['entry'] = (hospitals_df, dist_matrix)
+    return entry[1]
+
+# username -> (fetched_at, users.hospital_id). The admin endpoints all start by resolving
+# the caller's hospital, which only changes when ensure_hospital_link provisions one.
+USER_HOSPITAL_CACHE = {
+    'entries': {},
+    'max_entries': 2048,
+    'ttl': 60 # 1 minute
+}
+
+def get_user_hospital_id(conn, username):
+    """The user's hospital_id as stored (None/empty if unassigned; callers pick the fallback)."""
+    current_time = time.monotonic()
+    hit = USER_HOSPITAL_CACHE['entries'].get(username)
+    if hit and current_time - hit[0] < USER_HOSPITAL_CACHE['ttl']:
+        return hit[1]
+    row = conn.execute(SQL_USER_HOSPITAL, (username,)).fetchone()
+    hospital_id = row['hospital_id'] if row else None
+    entries = USER_HOSPITAL_CACHE['entries']
+    if len(entries) >= USER_HOSPITAL_CACHE['max_entries']:
+        entries.clear()
+    entries[username] = (current_time, hospital_id)
+    return hospital_id
+
+def invalidate_user_hospital(username):
+    USER_HOSPITAL_CACHE['entries'].pop(username, None)
+
 # --- Authentication Endpoints ---
 
 @app.post("/api/auth/register", response_model=Token)
@@ -64,10 +211,14 @@ def register(user: UserRegister):
     conn = get_db_connection()
     try:
         # Check if user exists
-        cur = conn.execute("SELECT * FROM users WHERE username = ?", (user.username,))
+        cur = conn.execute("SELECT 1 FROM users WHERE username = ?", (user.username,))
         if cur.fetchone():
             raise HTTPException(status_code=400, detail="Username already registered")
         
+        # bcrypt is deliberately slow: hash before the first write so the SQLite
+        # write lock is never held while it runs
+        hashed_pw = auth.get_password_hash(user.password)
+        
         if user.hospital_id:
              # Auto-create hospital if it doesn't exist
              h_exists = conn.execute("SELECT 1 FROM dim_hospital WHERE hospital_id = ?", (user.hospital_id,)).fetchone()
@@ -78,34 +229,77 @@ def register(user: UserRegister):
                     VALUES (?, ?, ?, ?, ?, ?)
                  """, (user.hospital_id, f"Hospital {user.hospital_id}", "Toronto", "Unknown", 43.65, -79.38))
 
-        hashed_pw = auth.get_password_hash(user.password)
         conn.execute("INSERT INTO users (username, password_hash, role, hospital_id) VALUES (?, ?, ?, ?)",
                      (user.username, hashed_pw, user.role, user.hospital_id))
         conn.commit()
+        invalidate_hospitals_cache()
+        refresh_max_bcrypt_cost(conn)
         
         access_token = auth.create_access_token(data={"sub": user.username, "role": user.role})
         return {"access_token": access_token, "token_type": "bearer", "role": user.role}
     finally:
-        conn.close()
+        release_db_connection(conn)
 
-@app.post("/api/auth/login", response_model=Token)
-def login(user: UserLogin):
+# Highest bcrypt cost among stored hashes ("$2b$12$..."): unknown-user logins are checked
+# against a dummy hash at this cost so they take as long as a real one
+SQL_MAX_BCRYPT_COST = "SELECT MAX(CAST(substr(password_hash, 5, 2) AS INTEGER)) FROM users WHERE password_hash LIKE '$2_$__$%'"
+
+# Read once (at startup or first use) instead of scanning users on every unknown-user login;
+# refreshed whenever this process stores a new hash
+BCRYPT_COST_CACHE = {
+    'max_cost': None
+}
+
+def refresh_max_bcrypt_cost(conn):
+    BCRYPT_COST_CACHE['max_cost'] = conn.execute(SQL_MAX_BCRYPT_COST).fetchone()[0] or auth.BCRYPT_ROUNDS
+    return BCRYPT_COST_CACHE['max_cost']
+
+def get_max_bcrypt_cost():
+    cost = BCRYPT_COST_CACHE['max_cost']
+    if cost is None:
+        conn = get_db_connection()
+        try:
+            cost = refresh_max_bcrypt_cost(conn)
+        finally:
+            release_db_connection(conn)
+    return cost
+
+def fetch_login_user(username):
     conn = get_db_connection()
     try:
-        cur = conn.execute("SELECT * FROM users WHERE username = ?", (user.username,))
-        db_user = cur.fetchone()
-        
-        if not db_user or not auth.verify_password(user.password, db_user['password_hash']):
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Incorrect username or password",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-            
-        access_token = auth.create_access_token(data={"sub": db_user['username'], "role": db_user['role']})
-        return {"access_token": access_token, "token_type": "bearer", "role": db_user['role']}
+        cur = conn.execute("SELECT username, password_hash, role FROM users WHERE username = ?", (username,))
+        return cur.fetchone()
     finally:
-        conn.close()
+        release_db_connection(conn)
+
+@app.on_event("startup")
+def warm_dummy_password_hash():
+    # Make the dummy hash now, so the first unknown-user login doesn't also pay to generate it
+    try:
+        auth.get_dummy_password_hash(get_max_bcrypt_cost())
+    except Exception as e:
+        print(f"Dummy password hash warm-up failed: {e}")
+
+@app.post("/api/auth/login", response_model=Token)
+async def login(user: UserLogin):
+    # Lookup and bcrypt run on the executor so the event loop keeps serving other logins
+    loop = asyncio.get_running_loop()
+    db_user = await loop.run_in_executor(None, fetch_login_user, user.username)
+    dummy_rounds = None if db_user else await loop.run_in_executor(None, get_max_bcrypt_cost)
+    
+    # Verify after releasing the connection; bcrypt dominates this request.
+    # Unknown usernames still pay for a (dummy) hash check at the stored hashes' cost.
+    password_hash = db_user['password_hash'] if db_user else None
+    verified = await loop.run_in_executor(None, auth.verify_password_or_dummy, user.password, password_hash, dummy_rounds)
+    if not verified:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Incorrect username or password",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+        
+    access_token = auth.create_access_token(data={"sub": db_user['username'], "role": db_user['role']})
+    return {"access_token": access_token, "token_type": "bearer", "role": db_user['role']}
 
 # Dependency
 from fastapi.security import OAuth2PasswordBearer
@@ -134,100 +328,179 @@ def health_check():
     return {"status": "ok"}
 
 
+def build_cluster_response(clusters, hospitals_df):
+    """Attach hospital details to each cluster via a key -> record index built once."""
+    records = hospitals_df[['hospital_id', 'name', 'latitude', 'longitude']].to_dict('records')
+    records_by_key = dict(zip(hospitals_df['hospital_key'].tolist(), records))
+    return [
+        {"cluster_id": cid, "members": [records_by_key[k] for k in h_keys if k in records_by_key]}
+        for cid, h_keys in clusters.items()
+    ]
+
+# Per-hospital daily flu counts for the miners. agg_patient_daily_flu is maintained from
+# patients by triggers (schema.sql), so this reads one row per hospital-day instead of
+# aggregating every patient.
+SQL_DAILY_FLU_COUNTS = """
+SELECT 
+    hospital_id as hospital_key, 
+    admission_date as date_key, 
+    flu_positive_count
+FROM agg_patient_daily_flu
+"""
+
+# Flu-positive cases per hospital over the last week (alert risk levels)
+SQL_RECENT_FLU_BY_HOSPITAL = """
+SELECT hospital_id, SUM(flu_positive_count)
+FROM agg_patient_daily_flu
+WHERE admission_date >= date('now', '-7 days')
+GROUP BY hospital_id
+"""
+
+# Alerts only need the recent window; the older history just adds rows to pivot
+SQL_RECENT_DAILY_FLU_COUNTS = SQL_DAILY_FLU_COUNTS + "WHERE admission_date >= date('now', '-30 days')\n"
+
 def run_simulation_internal(conn):
     try:
-        visits_df = pd.read_sql("SELECT count(*) FROM patients", conn) # Dummy check
-        # Real logic
-        query = """
-        SELECT 
-            hospital_id as hospital_key, 
-            admission_date as date_key, 
-            SUM(CASE WHEN is_flu_positive THEN 1 ELSE 0 END) as flu_positive_count
-        FROM patients
-        GROUP BY hospital_id, admission_date
-        """
-        visits_df = pd.read_sql(query, conn)
+        visits_df = fetch_df(conn, SQL_DAILY_FLU_COUNTS)
         
         if visits_df.empty: return {"clusters": [], "network": []}
         
-        visits_df['date_key'] = pd.to_datetime(visits_df['date_key'])
-        hospitals_df = pd.read_sql("SELECT * FROM dim_hospital", conn)
+        visits_df['date_key'] = pd.to_datetime(visits_df['date_key'], format='%Y-%m-%d')
+        hospitals_df = get_hospitals_df(conn)
         
         miner = OutbreakMiner(hospitals_df, visits_df)
-        dist_matrix = miner.compute_distance_matrix(metric='spatial')
+        dist_matrix = get_distance_matrix(miner, hospitals_df, 'spatial')
         clusters = miner.perform_clustering(dist_matrix, threshold=0.05)
         cluster_series = miner.calculate_cluster_series(clusters)
         edges = miner.predict_spread(cluster_series)
         
-        cluster_response = []
-        for cid, h_keys in clusters.items():
-            members = hospitals_df[hospitals_df['hospital_key'].isin(h_keys)][['hospital_id', 'name', 'latitude', 'longitude']].to_dict('records')
-            cluster_response.append({ "cluster_id": cid, "members": members })
+        cluster_response = build_cluster_response(clusters, hospitals_df)
             
         return {"clusters": cluster_response, "network": edges}
     except Exception as e:
         print(f"Mining Error: {e}")
         return {"clusters": [], "network": []}
 
+# The dashboard's clustering only changes with the data, so it is mined once per data version
+# (get_data_version) instead of on every poll. Mining runs off the request path: a poll that
+# sees a new version schedules a background refresh and is served the last result meanwhile.
+# The lock keeps overlapping refreshes from all re-mining at once.
+ANALYSIS_CACHE = {
+    'version': None,
+    'data': None
+}
+ANALYSIS_LOCK = threading.Lock()
+
+def refresh_dashboard_analysis():
+    # Another refresh is already mining; the next poll re-checks the version anyway
+    if not ANALYSIS_LOCK.acquire(blocking=False):
+        return
+    try:
+        conn = get_db_connection()
+        try:
+            version = get_data_version(conn)
+            if ANALYSIS_CACHE['version'] != version:
+                ANALYSIS_CACHE['data'] = run_simulation_internal(conn)
+                ANALYSIS_CACHE['version'] = version
+        finally:
+            release_db_connection(conn)
+    except Exception as e:
+        print(f"Dashboard analysis refresh failed: {e}")
+    finally:
+        ANALYSIS_LOCK.release()
+
+def get_dashboard_analysis(conn, background_tasks: BackgroundTasks):
+    if ANALYSIS_CACHE['version'] != get_data_version(conn):
+        background_tasks.add_task(refresh_dashboard_analysis)
+    # Stale (or, before the first refresh lands, empty) until the background refresh completes
+    return ANALYSIS_CACHE['data'] or {"clusters": [], "network": []}
+
+@app.on_event("startup")
+def warm_dashboard_analysis():
+    # Mine once at startup so the first dashboard polls aren't served an empty analysis
+    refresh_dashboard_analysis()
+
+@app.on_event("startup")
+def check_daily_flu_table():
+    # The miners read agg_patient_daily_flu; flag a database created before it was added
+    conn = get_db_connection()
+    try:
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'agg_patient_daily_flu'").fetchone():
+            print("WARNING: agg_patient_daily_flu not found. Please run 'setup_database.py' to apply the schema.")
+    finally:
+        release_db_connection(conn)
+
 @app.get("/api/public/dashboard")
-def get_public_dashboard():
+def get_public_dashboard(background_tasks: BackgroundTasks):
     """
-    Public Endpoint: Returns live stats and latest analysis results (cached or computed).
+    Public Endpoint: Returns live stats and the latest analysis results (refreshed in the background).
     """
     conn = get_db_connection()
     try:
-        # Live Stats from Patients Table
-        total_patients = conn.execute("SELECT COUNT(*) FROM patients").fetchone()[0]
-        flu_positive = conn.execute("SELECT COUNT(*) FROM patients WHERE is_flu_positive = 1").fetchone()[0]
-        
-        # Get active hospitals (those with patient data)
-        active_hospitals = conn.execute("SELECT COUNT(DISTINCT hospital_id) FROM patients").fetchone()[0]
-        
+        # Live Stats and per-hospital activity in one statement and one pass over patients:
+        # the per-hospital aggregate (index-only on idx_patients_agg) also feeds the totals
+        # (active hospitals = those with patient data). Totals ride along on every row, and a
+        # lone all-NULL hospital row still carries them when dim_hospital is empty.
+        #
         # Logic: Estimate Resource Usage based on Flu Positive Count
         # Severity Assumptions: 15% Hospitalized, 5% ICU, 2% Vent
         # We need per-hospital stats to map to capacity
         
-        hospitals_query = """
+        dashboard_query = """
+        WITH per_hospital AS (
+            SELECT
+                hospital_id,
+                COUNT(*) AS patients,
+                COUNT(CASE WHEN is_flu_positive = 1 THEN 1 END) AS flu,
+                COUNT(CASE WHEN admission_date >= date('now', '-14 days') THEN 1 END) AS active_cases, -- Active window
+                SUM(CASE WHEN admission_date >= date('now', '-14 days') AND is_flu_positive THEN 1 ELSE 0 END) AS active_flu
+            FROM patients
+            GROUP BY hospital_id
+        ),
+        totals AS (
+            SELECT COALESCE(SUM(patients), 0) AS total_patients, COALESCE(SUM(flu), 0) AS flu_positive,
+                   COUNT(hospital_id) AS active_hospitals
+            FROM per_hospital
+        )
         SELECT 
             h.hospital_id, h.name, h.latitude, h.longitude, h.city, h.region,
             h.total_beds, h.icu_beds, h.ventilators,
-            COUNT(p.patient_id) as active_cases,
-            SUM(CASE WHEN p.is_flu_positive THEN 1 ELSE 0 END) as active_flu
-        FROM dim_hospital h
-        LEFT JOIN patients p ON h.hospital_id = p.hospital_id AND p.admission_date >= date('now', '-14 days') -- Active window
-        GROUP BY h.hospital_id
+            COALESCE(p.active_cases, 0) as active_cases,
+            COALESCE(p.active_flu, 0) as active_flu,
+            t.total_patients, t.flu_positive, t.active_hospitals
+        FROM totals t
+        LEFT JOIN dim_hospital h ON 1
+        LEFT JOIN per_hospital p ON p.hospital_id = h.hospital_id
+        ORDER BY h.hospital_id
         """
         
-        hospitals_rows = conn.execute(hospitals_query).fetchall()
-        hospitals_list = []
+        dashboard_rows = conn.execute(dashboard_query).fetchall()
+        total_patients, flu_positive, active_hospitals = tuple(dashboard_rows[0])[-3:]
+        hospital_fields = dashboard_rows[0].keys()[:-3]
+        hospitals_list = [dict(zip(hospital_fields, row)) for row in dashboard_rows if row['hospital_id'] is not None]
         
-        system_icu_capacity = 0
-        system_icu_usage = 0
+        # Estimate usage for all hospitals at once
+        icu_beds = np.array([h['icu_beds'] for h in hospitals_list], dtype=np.int64)
+        total_beds = np.array([h['total_beds'] for h in hospitals_list], dtype=np.int64)
+        active_flu = np.array([h['active_flu'] or 0 for h in hospitals_list], dtype=np.int64)
         
-        for row in hospitals_rows:
-            h = dict(row)
-            # Estimate usage
-            active_flu = h['active_flu'] if h['active_flu'] else 0
-            
-            # Estimated resources in use (Baseline 60% + Outbreak impact)
-            icu_used = int(h['icu_beds'] * 0.1) + int(active_flu * 0.15) # 10% baseline + 15% of flu cases
-            bed_used = int(h['total_beds'] * 0.6) + int(active_flu * 0.40) # 60% baseline + 40% of flu cases
-            
-            # Cap at max
-            icu_used = min(icu_used, h['icu_beds'])
-            bed_used = min(bed_used, h['total_beds'])
-            
+        # Estimated resources in use (Baseline 60% + Outbreak impact), each term truncated, capped at max
+        icu_used = np.minimum((icu_beds * 0.1).astype(np.int64) + (active_flu * 0.15).astype(np.int64), icu_beds) # 10% baseline + 15% of flu cases
+        bed_used = np.minimum((total_beds * 0.6).astype(np.int64) + (active_flu * 0.40).astype(np.int64), total_beds) # 60% baseline + 40% of flu cases
+        icu_utilization = np.round(np.divide(icu_used, icu_beds, out=np.zeros(len(icu_beds)), where=icu_beds > 0) * 100, 1)
+        bed_utilization = np.round(np.divide(bed_used, total_beds, out=np.zeros(len(total_beds)), where=total_beds > 0) * 100, 1)
+        
+        for h, beds, icu, icu_pct, bed_pct in zip(hospitals_list, bed_used.tolist(), icu_used.tolist(),
+                                                 icu_utilization.tolist(), bed_utilization.tolist()):
             h['usage'] = {
-                'beds_used': bed_used,
-                'icu_used': icu_used,
-                'icu_utilization': round((icu_used / h['icu_beds'] if h['icu_beds'] > 0 else 0) * 100, 1),
-                'bed_utilization': round((bed_used / h['total_beds'] if h['total_beds'] > 0 else 0) * 100, 1)
+                'beds_used': beds,
+                'icu_used': icu,
+                'icu_utilization': icu_pct,
+                'bed_utilization': bed_pct
             }
-            
-            hospitals_list.append(h)
-            
-            system_icu_capacity += h['icu_beds']
-            system_icu_usage += icu_used
+        
+        system_icu_capacity = int(icu_beds.sum())
+        system_icu_usage = int(icu_used.sum())
 
         system_stress = (system_icu_usage / system_icu_capacity) if system_icu_capacity > 0 else 0
 
@@ -236,24 +509,41 @@ def get_public_dashboard():
                 "hospitals": active_hospitals,
                 "total_visits": total_patients,
                 "flu_positive": flu_positive,
-                "risk_level": "CRITICAL" if system_stress > 0.8 else "ELEVATED" if system_stress > 0.5 else "NOMINAL",
+                "risk_level": RISK_LEVELS[bisect.bisect_left(RISK_THRESHOLDS, system_stress)],
                 "system_stress": round(system_stress * 100, 1)
             },
             "hospitals_list": hospitals_list,
-            # On-the-fly Clustering for Public View
-            "analysis": run_simulation_internal(conn) 
+            # Clustering for Public View, re-mined in the background when the data changes
+            "analysis": get_dashboard_analysis(conn, background_tasks)
         }
     finally:
-        conn.close()
+        release_db_connection(conn)
+
+# The history payload is a pure function of the patient data and the 30-day window,
+# so it is built and JSON-encoded once per (get_data_version(), window start) instead of per request.
+# 'entry' holds (cache_key, encoded bytes) and is swapped as one tuple so concurrent
+# requests never pair one key with another request's payload.
+HISTORY_CACHE = {
+    'entry': None
+}
+
+# Column order of each per-hospital row in the history payload
+HISTORY_FIELDS = ("hospital_id", "lat", "lon", "count")
 
 @app.get("/api/public/history")
 def get_public_history():
     """
     Returns daily case counts per hospital for the last 30 days.
-    Used for Time-Lapse Map.
+    Used for Time-Lapse Map. Rows are arrays in HISTORY_FIELDS order.
     """
     conn = get_db_connection()
     try:
+        window_start = conn.execute("SELECT date('now', '-30 days')").fetchone()[0]
+        cache_key = (get_data_version(conn), window_start)
+        entry = HISTORY_CACHE['entry']
+        if entry is not None and entry[0] == cache_key:
+            return Response(content=entry[1], media_type="application/json")
+        
         # Get last 30 days data
         query = """
         SELECT 
@@ -264,33 +554,29 @@ def get_public_history():
             COUNT(*) as case_count
         FROM patients p
         JOIN dim_hospital h ON p.hospital_id = h.hospital_id
-        WHERE p.admission_date >= date('now', '-30 days')
+        WHERE p.admission_date >= ?
         AND p.is_flu_positive = 1
         GROUP BY p.admission_date, p.hospital_id
         ORDER BY p.admission_date ASC
         """
-        rows = conn.execute(query).fetchall()
-        
-        # Structure: { "2023-10-01": [ {lat, lon, count}, ... ] }
-        history = {}
-        for r in rows:
-            date = r['admission_date']
-            if date not in history: history[date] = []
-            history[date].append({
-                "hospital_id": r['hospital_id'],
-                "lat": r['latitude'],
-                "lon": r['longitude'],
-                "count": r['case_count']
-            })
-            
-        return history
+        rows = conn.execute(query, (window_start,)).fetchall()
+        
+        # Structure: { "2023-10-01": [ [hospital_id, lat, lon, count], ... ] }
+        # Positional rows instead of per-row dicts: no dict per marker and no repeated keys on the wire
+        # Rows arrive ordered by date, so each day is one contiguous run: bucket with groupby
+        history = {date: [row[1:] for row in day_rows] for date, day_rows in itertools.groupby(rows, key=operator.itemgetter(0))}
+        
+        # Encode once and serve the bytes directly, skipping FastAPI's per-request jsonable_encoder pass
+        payload = orjson.dumps(history)
+        HISTORY_CACHE['entry'] = (cache_key, payload)
+        return Response(content=payload, media_type="application/json")
     finally:
-        conn.close()
+        release_db_connection(conn)
 
 # --- Patient Management (Hospital Admin) ---
 
 class PatientEntry(BaseModel):
-    admission_date: str # YYYY-MM-DD
+    admission_date: date # YYYY-MM-DD, validated on the way in (422 if malformed)
     is_flu_positive: bool
 
 @app.post("/api/patients")
@@ -301,55 +587,37 @@ def add_patient(entry: PatientEntry, role: str = Depends(require_admin), user=De
     conn = get_db_connection()
     try:
         # Get Admin's Hospital ID
-        cur = conn.execute("SELECT hospital_id FROM users WHERE username = ?", (user['sub'],))
-        row = cur.fetchone()
-        if not row or not row['hospital_id']:
-            # Fallback for 'Super Admins' or Demo: If no hospital assigned, assign random or ID='H000'
-            # For this demo, let's assign to 'Toronto General' (ID 'H000') if null
-            hospital_id = 'H000' 
-        else:
-            hospital_id = row['hospital_id']
+        # Fallback for 'Super Admins' or Demo: If no hospital assigned, assign random or ID='H000'
+        # For this demo, let's assign to 'Toronto General' (ID 'H000') if null
+        hospital_id = get_user_hospital_id(conn, user['sub']) or 'H000'
 
         conn.execute(
             "INSERT INTO patients (hospital_id, admission_date, is_flu_positive) VALUES (?, ?, ?)",
-            (hospital_id, entry.admission_date, entry.is_flu_positive)
+            (hospital_id, entry.admission_date.isoformat(), entry.is_flu_positive)
         )
         conn.commit()
         return {"status": "success", "message": "Patient record added"}
     finally:
-        conn.close()
+        release_db_connection(conn)
 
 @app.get("/api/patients/recent")
 def get_recent_patients(role: str = Depends(require_admin), user=Depends(get_current_user)):
     conn = get_db_connection()
     try:
-        # Get Admin's Hospital ID
-        # Get Admin's Hospital PK
-        cur = conn.execute("SELECT hospital_id FROM users WHERE username = ?", (user['sub'],))
-        row = cur.fetchone()
-        hospital_pk = row['hospital_id'] if row and row['hospital_id'] else None
-
-        if hospital_pk:
-             # Resolve to Text ID (H000...)
-            cur = conn.execute("SELECT hospital_id FROM dim_hospital WHERE hospital_key = ?", (hospital_pk,))
-            h_row = cur.fetchone()
-            hospital_id = h_row['hospital_id'] if h_row else 'H000'
-        else:
-            hospital_id = 'H000'
-
+        # Admin's Hospital PK resolved to its Text ID (H000...) inside the same statement
         recent = conn.execute(
-            """
+            f"""
             SELECT p.patient_id, p.admission_date, p.is_flu_positive, p.status, COALESCE(h.name, 'Unknown Hospital') as hospital_name
             FROM patients p
             LEFT JOIN dim_hospital h ON p.hospital_id = h.hospital_id
-            WHERE p.hospital_id = ?
+            WHERE p.hospital_id = {SQL_USER_HOSPITAL_BY_KEY_SUBQUERY}
             ORDER BY p.patient_id DESC LIMIT 50
-            """, (hospital_id,)
+            """, (user['sub'],)
         ).fetchall()
         
         return [dict(row) for row in recent]
     finally:
-        conn.close()
+        release_db_connection(conn)
 
 @app.delete("/api/patients/{patient_id}")
 def delete_patient(patient_id: int, role: str = Depends(require_admin)):
@@ -359,7 +627,7 @@ def delete_patient(patient_id: int, role: str = Depends(require_admin)):
         conn.commit()
         return {"status": "deleted"}
     finally:
-        conn.close()
+        release_db_connection(conn)
 
 class StatusUpdate(BaseModel):
     status: str
@@ -372,7 +640,7 @@ def update_patient_status(patient_id: int, update: StatusUpdate, role: str = Dep
         conn.commit()
         return {"status": "updated", "new_status": update.status}
     finally:
-        conn.close()
+        release_db_connection(conn)
 
 class HospitalProfile(BaseModel):
     name: str | None = None
@@ -386,6 +654,7 @@ def ensure_hospital_link(username, hospital_id, conn):
     """
     Ensures a user is linked to a valid hospital.
     Auto-creates hospital and proper link if missing.
+    Does not commit: the caller commits once with its own writes.
     Returns: Valid hospital_id
     """
     # 1. If hospital_id is present, check if valid
@@ -407,7 +676,7 @@ def ensure_hospital_link(username, hospital_id, conn):
     
     # Link User
     conn.execute("UPDATE users SET hospital_id = ? WHERE username = ?", (new_hid, username))
-    conn.commit()
+    invalidate_user_hospital(username)
     
     print(f"Auto-provisioned hospital {new_hid} for user {username}")
     return new_hid
@@ -417,12 +686,13 @@ def get_hospital_profile(user=Depends(get_current_user)):
     conn = get_db_connection()
     try:
         # Resolve user to hospital
-        cur = conn.execute("SELECT hospital_id FROM users WHERE username = ?", (user['sub'],))
-        row = cur.fetchone()
+        current_hid = get_user_hospital_id(conn, user['sub'])
         
         # AUTO-PROVISIONING: Ensure link exists
-        current_hid = row['hospital_id'] if row else None
         hospital_pk = ensure_hospital_link(user['sub'], current_hid, conn)
+        if conn.in_transaction: # A hospital was provisioned
+            conn.commit()
+            invalidate_hospitals_cache()
              
         profile = conn.execute("SELECT * FROM dim_hospital WHERE hospital_id = ?", (hospital_pk,)).fetchone()
         return dict(profile) if profile else {}
@@ -430,18 +700,16 @@ def get_hospital_profile(user=Depends(get_current_user)):
         print(f"Profile Fetch Error: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch profile")
     finally:
-        conn.close()
+        release_db_connection(conn)
 
 @app.post("/api/hospital/profile")
 def update_hospital_profile(profile: HospitalProfile, user=Depends(get_current_user), role: str = Depends(require_admin)):
     conn = get_db_connection()
     try:
         # Resolve user to hospital
-        cur = conn.execute("SELECT hospital_id FROM users WHERE username = ?", (user['sub'],))
-        row = cur.fetchone()
+        current_hid = get_user_hospital_id(conn, user['sub'])
         
         # AUTO-PROVISIONING: Ensure link exists before update
-        current_hid = row['hospital_id'] if row else None
         hospital_pk = ensure_hospital_link(user['sub'], current_hid, conn)
 
         # Update
@@ -465,31 +733,49 @@ def update_hospital_profile(profile: HospitalProfile, user=Depends(get_current_u
              values.append(profile.longitude)
              
         if not fields:
+            if conn.in_transaction: # Keep a freshly provisioned hospital
+                conn.commit()
+                invalidate_hospitals_cache()
             return {"status": "no_change"}
             
         values.append(hospital_pk)
         query = f"UPDATE dim_hospital SET {', '.join(fields)} WHERE hospital_id = ?"
         
+        # Provisioning (if any) and the update land in one commit
         conn.execute(query, tuple(values))
         conn.commit()
+        # Coordinates may have moved; the data version does not cover updates
+        HISTORY_CACHE['entry'] = None
+        SIMULATION_CACHE['version'] = None
+        ANALYSIS_CACHE['version'] = None
+        invalidate_hospitals_cache()
         
     finally:
-        conn.close()
+        release_db_connection(conn)
 
 # --- API Key Management (ERP Integration) ---
 from integrations.erp_integration import ERPIntegration
 
+# Shared integrator so its SQLite connection is opened once and reused across events
+erp_integrator = ERPIntegration(db_path=DB_PATH)
+
+# Upper bound on admissions accepted in one batched packet
+ERP_MAX_BATCH = 10000
+
 class ERPPacket(BaseModel):
     api_key: str
     event_type: str
-    data: dict
+    # A single admission, or a batch of up to ERP_MAX_BATCH of them
+    data: dict | list[dict]
 
 @app.post("/api/v1/connect/admission")
-async def receive_erp_event(packet: ERPPacket):
+def receive_erp_event(packet: ERPPacket):
     """
     Endpoint for External ERP Systems to push patient data.
+    Sync on purpose: the integrator's lock can be held by its flusher for a whole batch
+    write, so this runs on a worker thread rather than blocking the event loop.
     """
-    integrator = ERPIntegration(db_path=DB_PATH)
+    integrator = erp_integrator
     
     # 1. Validate Key
     hospital_pk = integrator.validate_api_key(packet.api_key)
@@ -498,6 +784,15 @@ async def receive_erp_event(packet: ERPPacket):
 
     # 2. Process Data
     if packet.event_type == "ADMISSION":
+        if isinstance(packet.data, list):
+            # Batched feed: one request (and one write batch) for many admissions
+            if len(packet.data) > ERP_MAX_BATCH:
+                raise HTTPException(status_code=413, detail=f"At most {ERP_MAX_BATCH} admissions per packet")
+            results = integrator.process_admission_events(hospital_pk, packet.data)
+            if packet.data and not any(results):
+                raise HTTPException(status_code=500, detail="Ingestion failed")
+            return {"status": "success", "message": f"{sum(results)} of {len(results)} records ingested", "results": results}
+
         success = integrator.process_admission_event(hospital_pk, packet.data)
         if success:
             return {"status": "success", "message": "Data ingested"}
@@ -511,9 +806,7 @@ def get_api_key(user=Depends(get_current_user)):
     conn = get_db_connection()
     try:
         # Get Hospital ID
-        cur = conn.execute("SELECT hospital_id FROM users WHERE username = ?", (user['sub'],))
-        row = cur.fetchone()
-        hospital_pk = row['hospital_id'] if row and row['hospital_id'] else None
+        hospital_pk = get_user_hospital_id(conn, user['sub'])
         
         if not hospital_pk:
             return {"api_secret": None}
@@ -522,16 +815,14 @@ def get_api_key(user=Depends(get_current_user)):
         key_row = conn.execute("SELECT api_secret FROM api_keys WHERE hospital_id = ? AND is_active = 1 ORDER BY created_at DESC LIMIT 1", (hospital_pk,)).fetchone()
         return {"api_secret": key_row['api_secret'] if key_row else None}
     finally:
-        conn.close()
+        release_db_connection(conn)
 
 @app.post("/api/hospital/key")
 def generate_api_key(user=Depends(get_current_user), role: str = Depends(require_admin)):
     conn = get_db_connection()
     try:
         # Get Hospital ID
-        cur = conn.execute("SELECT hospital_id FROM users WHERE username = ?", (user['sub'],))
-        row = cur.fetchone()
-        hospital_pk = row['hospital_id'] if row and row['hospital_id'] else None
+        hospital_pk = get_user_hospital_id(conn, user['sub'])
         
         if not hospital_pk:
              raise HTTPException(status_code=400, detail="User not linked to a hospital")
@@ -549,7 +840,7 @@ def generate_api_key(user=Depends(get_current_user), role: str = Depends(require
         
         return {"api_secret": new_secret}
     finally:
-        conn.close()
+        release_db_connection(conn)
 
 # --- Phase 8: Advanced Hospital Management ---
 
@@ -561,29 +852,22 @@ class CapacityUpdate(BaseModel):
 def get_capacity(role: str = Depends(require_admin), user=Depends(get_current_user)):
     conn = get_db_connection()
     try:
-        cur = conn.execute("SELECT hospital_id FROM users WHERE username = ?", (user['sub'],))
-        row = cur.fetchone()
-        hid = row['hospital_id'] if row and row['hospital_id'] else 'H000'
-        
-        stats = conn.execute("SELECT total_beds, occupied_beds FROM dim_hospital WHERE hospital_id = ?", (hid,)).fetchone()
+        stats = conn.execute(f"SELECT total_beds, occupied_beds FROM dim_hospital WHERE hospital_id = {SQL_USER_HOSPITAL_SUBQUERY}",
+                             (user['sub'],)).fetchone()
         return dict(stats) if stats else {"total_beds": 100, "occupied_beds": 0}
     finally:
-        conn.close()
+        release_db_connection(conn)
 
 @app.post("/api/hospital/capacity")
 def update_capacity(data: CapacityUpdate, role: str = Depends(require_admin), user=Depends(get_current_user)):
     conn = get_db_connection()
     try:
-        cur = conn.execute("SELECT hospital_id FROM users WHERE username = ?", (user['sub'],))
-        row = cur.fetchone()
-        hid = row['hospital_id'] if row and row['hospital_id'] else 'H000'
-        
-        conn.execute("UPDATE dim_hospital SET total_beds = ?, occupied_beds = ? WHERE hospital_id = ?", 
-                    (data.total_beds, data.occupied_beds, hid))
+        conn.execute(f"UPDATE dim_hospital SET total_beds = ?, occupied_beds = ? WHERE hospital_id = {SQL_USER_HOSPITAL_SUBQUERY}", 
+                    (data.total_beds, data.occupied_beds, user['sub']))
         conn.commit()
         return {"status": "updated"}
     finally:
-        conn.close()
+        release_db_connection(conn)
 
 
 
@@ -591,114 +875,162 @@ def update_capacity(data: CapacityUpdate, role: str = Depends(require_admin), us
 def get_analytics(role: str = Depends(require_admin), user=Depends(get_current_user)):
     conn = get_db_connection()
     try:
-        cur = conn.execute("SELECT hospital_id FROM users WHERE username = ?", (user['sub'],))
-        row = cur.fetchone()
-        hospital_pk = row['hospital_id'] if row and row['hospital_id'] else None
-        
-        if hospital_pk:
-             # Resolve to Text ID (H000...)
-            cur = conn.execute("SELECT hospital_id FROM dim_hospital WHERE hospital_key = ?", (hospital_pk,))
-            h_row = cur.fetchone()
-            hid = h_row['hospital_id'] if h_row else 'H000'
-        else:
-            hid = 'H000'
-        
-        # 7-Day Trend
-        query = """
+        # 7-Day Trend (Admin's Hospital PK resolved to its Text ID in the same statement)
+        query = f"""
         SELECT admission_date, COUNT(*) as count, SUM(is_flu_positive) as flu_positive
         FROM patients 
-        WHERE hospital_id = ? 
+        WHERE hospital_id = {SQL_USER_HOSPITAL_BY_KEY_SUBQUERY}
         GROUP BY admission_date 
         ORDER BY admission_date DESC LIMIT 7
         """
-        trend = [dict(row) for row in conn.execute(query, (hid,)).fetchall()]
+        trend = [dict(row) for row in conn.execute(query, (user['sub'],)).fetchall()]
         
         return trend[::-1] # Return chronological order
     finally:
-        conn.close()
+        release_db_connection(conn)
 
 @app.post("/api/hospital/upload")
-async def upload_patients(file: UploadFile = File(...), role: str = Depends(require_admin), user=Depends(get_current_user)):
+def upload_patients(file: UploadFile = File(...), role: str = Depends(require_admin), user=Depends(get_current_user)):
     # Simple CSV parser: Date, IsFlu (0/1 or True/False)
     conn = get_db_connection()
     try:
-        cur = conn.execute("SELECT hospital_id FROM users WHERE username = ?", (user['sub'],))
-        row = cur.fetchone()
-        hid = row['hospital_id'] if row and row['hospital_id'] else 'H000'
-        
-        content = await file.read()
-        text = content.decode('utf-8')
-        lines = text.split('\n')
-        
-        count = 0
-        for line in lines[1:]: # Skip header
-            parts = line.strip().split(',')
-            if len(parts) >= 2:
-                date = parts[0].strip()
-                is_flu = parts[1].strip().lower() in ['true', '1', 'yes']
-                conn.execute(
-                    "INSERT INTO patients (hospital_id, admission_date, is_flu_positive) VALUES (?, ?, ?)",
-                    (hid, date, is_flu)
-                )
-                count += 1
+        hid = get_user_hospital_id(conn, user['sub']) or 'H000'
+        
+        # Parse and coerce the whole file in one vectorized pass (header row is skipped),
+        # reading the spooled upload in place rather than copying it into memory first.
+        # Both columns repeat heavily (a few dates, two flag spellings), so read them as
+        # categoricals: one small code per row, and each distinct value is cleaned once.
+        # An empty or header-only file simply yields no rows.
+        try:
+            df = pd.read_csv(file.file, usecols=[0, 1], names=['admission_date', 'is_flu'],
+                             header=0, dtype='category', skipinitialspace=True)
+        except pd.errors.ParserError:
+            # A single-column file has no flu flag to import: report every row as skipped
+            file.file.seek(0)
+            rows = pd.read_csv(file.file, header=0, dtype=str)
+            if len(rows.columns) >= 2:
+                raise
+            return {"status": "success", "imported": 0, "skipped": len(rows)}
+        # Rows missing the date or the flag count as skipped, like unparseable dates
+        total = len(df)
+        df = df.dropna()
+        date_col, flu_col = df['admission_date'].cat, df['is_flu'].cat
+        parsed_dates = pd.to_datetime(date_col.categories.str.strip(), format='%Y-%m-%d', errors='coerce')
+        dates = parsed_dates.strftime('%Y-%m-%d').to_numpy()[date_col.codes]
+        flu_flags = flu_col.categories.str.strip().str.lower().isin(['true', '1', 'yes'])[flu_col.codes]
+
+        # Rows whose date does not parse are skipped (mask instead of per-row try/except)
+        valid = ~parsed_dates.isna()[date_col.codes]
+
+        # Single executemany inside one transaction instead of one INSERT per line
+        conn.executemany(
+            "INSERT INTO patients (hospital_id, admission_date, is_flu_positive) VALUES (?, ?, ?)",
+            zip(itertools.repeat(hid), dates[valid].tolist(), flu_flags[valid].tolist())
+        )
         conn.commit()
-        return {"status": "success", "imported": count}
+        imported = int(valid.sum())
+        return {"status": "success", "imported": imported, "skipped": total - imported}
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Upload failed: {str(e)}")
     finally:
-        conn.close()
+        release_db_connection(conn)
+
+EXPORT_BATCH_SIZE = 1000
 
 @app.get("/api/hospital/export")
 def export_patients(role: str = Depends(require_admin), user=Depends(get_current_user)):
+    # The response body is iterated on worker threads; pooled connections allow that
     conn = get_db_connection()
     try:
-        cur = conn.execute("SELECT hospital_id FROM users WHERE username = ?", (user['sub'],))
-        row = cur.fetchone()
-        hid = row['hospital_id'] if row and row['hospital_id'] else 'H000'
+        hid = get_user_hospital_id(conn, user['sub']) or 'H000'
         
-        rows = conn.execute("SELECT admission_date, is_flu_positive FROM patients WHERE hospital_id = ?", (hid,)).fetchall()
-        
-        # Generate CSV string
-        output = "Date,Flu_Positive\n"
-        for r in rows:
-            output += f"{r['admission_date']},{r['is_flu_positive']}\n"
-            
-        return Response(content=output, media_type="text/csv", headers={"Content-Disposition": "attachment; filename=patients.csv"})
-    finally:
-        conn.close()
+        cur = conn.execute("SELECT admission_date, is_flu_positive FROM patients WHERE hospital_id = ?", (hid,))
+    except Exception:
+        release_db_connection(conn)
+        raise
+    
+    # Stream the CSV in batches straight from the cursor instead of building the whole
+    # file in memory first; the connection is released once the generator is exhausted.
+    def generate():
+        try:
+            yield "Date,Flu_Positive\n"
+            while True:
+                rows = cur.fetchmany(EXPORT_BATCH_SIZE)
+                if not rows:
+                    break
+                yield "".join(f"{r['admission_date']},{r['is_flu_positive']}\n" for r in rows)
+        finally:
+            cur.close()
+            release_db_connection(conn)
+    
+    return StreamingResponse(generate(), media_type="text/csv", headers={"Content-Disposition": "attachment; filename=patients.csv"})
+
+# Forecasts only change when patients or hospitals change, so cache them per data version.
+# Key: (hospital_id, days), reset whenever get_data_version() moves. The miner built from
+# the full visits aggregate is kept too, so forecasting another hospital reuses it.
+# Bounded because days is free-form client input.
+PREDICTION_CACHE = {
+    'version': None,
+    'miner': None,
+    'results': {},
+    'max_entries': 256
+}
+
+def get_data_version(conn):
+    """Cheap fingerprint of the mined tables: ids are AUTOINCREMENT, so inserts and deletes both move it."""
+    row = conn.execute("""
+        SELECT
+            (SELECT MAX(patient_id) FROM patients),
+            (SELECT COUNT(*) FROM patients),
+            (SELECT MAX(hospital_key) FROM dim_hospital),
+            (SELECT COUNT(*) FROM dim_hospital)
+    """).fetchone()
+    return tuple(row)
+
+def build_prediction_miner(conn):
+    """One grouped query over all hospitals, shared by every hospital's forecast. None if no data."""
+    # 1. Get All Data for Mining Engine
+    # We need ALL hospitals data to normalize properly (or just this one? Engine expects all usually)
+    # But for simple single-series prediction, we might just need this hospital's data.
+    # However, OutbreakMiner architecture takes full DF. Let's stick to that for consistency.
+    
+    visits_df = fetch_df(conn, SQL_DAILY_FLU_COUNTS)
+    
+    if visits_df.empty:
+        return None
+
+    visits_df['date_key'] = pd.to_datetime(visits_df['date_key'], format='%Y-%m-%d')
+    hospitals_df = get_hospitals_df(conn)
+    
+    return OutbreakMiner(hospitals_df, visits_df)
 
 @app.get("/api/hospital/predict")
 def get_prediction(days: int = 7, role: str = Depends(require_admin), user=Depends(get_current_user)):
     conn = get_db_connection()
     try:
-        cur = conn.execute("SELECT hospital_id FROM users WHERE username = ?", (user['sub'],))
-        row = cur.fetchone()
-        hid = row['hospital_id'] if row and row['hospital_id'] else 'H000'
+        hid = get_user_hospital_id(conn, user['sub']) or 'H000'
         
-        # 1. Get All Data for Mining Engine
-        # We need ALL hospitals data to normalize properly (or just this one? Engine expects all usually)
-        # But for simple single-series prediction, we might just need this hospital's data.
-        # However, OutbreakMiner architecture takes full DF. Let's stick to that for consistency.
+        version = get_data_version(conn)
+        if PREDICTION_CACHE['version'] != version:
+            PREDICTION_CACHE['version'] = version
+            PREDICTION_CACHE['miner'] = None
+            PREDICTION_CACHE['results'] = {}
+        cached = PREDICTION_CACHE['results'].get((hid, days))
+        if cached is not None:
+            return cached
         
-        query = """
-        SELECT 
-            hospital_id as hospital_key, 
-            admission_date as date_key, 
-            SUM(CASE WHEN is_flu_positive THEN 1 ELSE 0 END) as flu_positive_count
-        FROM patients
-        GROUP BY hospital_id, admission_date
-        """
-        visits_df = pd.read_sql(query, conn)
+        miner = PREDICTION_CACHE['miner']
+        if miner is None:
+            miner = build_prediction_miner(conn)
+            if miner is None:
+                return []
+            PREDICTION_CACHE['miner'] = miner
         
-        if visits_df.empty:
-            return []
-
-        visits_df['date_key'] = pd.to_datetime(visits_df['date_key'])
-        hospitals_df = pd.read_sql("SELECT * FROM dim_hospital", conn)
-        
-        miner = OutbreakMiner(hospitals_df, visits_df)
         prediction = miner.predict_hospital_visits(hid, horizon=days)
         
+        if len(PREDICTION_CACHE['results']) >= PREDICTION_CACHE['max_entries']:
+            PREDICTION_CACHE['results'] = {}
+        PREDICTION_CACHE['results'][(hid, days)] = prediction
         return prediction
     except Exception as e:
         print(f"Prediction API Error: {e}")
@@ -707,7 +1039,15 @@ def get_prediction(days: int = 7, role: str = Depends(require_admin), user=Depen
             traceback.print_exc(file=f)
         raise HTTPException(status_code=500, detail=str(e))
     finally:
-        conn.close()
+        release_db_connection(conn)
+
+# Simulation results per (metric, threshold), reset whenever get_data_version() moves.
+# Bounded because threshold is free-form client input.
+SIMULATION_CACHE = {
+    'version': None,
+    'results': {},
+    'max_entries': 32
+}
 
 @app.post("/api/simulation/run")
 def run_simulation(metric: str = 'spatial', threshold: float = 0.05, role: str = Depends(require_admin)):
@@ -716,60 +1056,58 @@ def run_simulation(metric: str = 'spatial', threshold: float = 0.05, role: str =
     """
     conn = get_db_connection()
     try:
+        version = get_data_version(conn)
+        if SIMULATION_CACHE['version'] != version:
+            SIMULATION_CACHE['version'] = version
+            SIMULATION_CACHE['results'] = {}
+        cached = SIMULATION_CACHE['results'].get((metric, threshold))
+        if cached is not None:
+            return cached
+        
         # 1. Aggregate Patient Data -> Visit Counts
         # We need to transform 'patients' table into the format expected by OutbreakMiner (fact_daily_visits like)
         # Expected: hospital_key, date_key, flu_positive_count
         
-        # Check if we have data
-        count = conn.execute("SELECT COUNT(*) FROM patients").fetchone()[0]
+        # Check if we have data (the version fingerprint already carries the patient count)
+        count = version[1]
         if count == 0:
             # Fallback to static data if no live data yet (for demo continuity)
             print("No live data, using static warehouse...")
-            visits_df = pd.read_sql("SELECT hospital_key, date_key, flu_positive_count FROM fact_daily_visits", conn)
+            visits_df = fetch_df(conn, "SELECT hospital_key, date_key, flu_positive_count FROM fact_daily_visits")
         else:
             print("Using Live Patient Data...")
             # Aggregate Live Data
             # Note: Mining Engine expects 'hospital_key' which matches 'hospital_id' in our schema roughly
             # Group by Hospital and Date
-            query = """
-            SELECT 
-                hospital_id as hospital_key, 
-                admission_date as date_key, 
-                SUM(CASE WHEN is_flu_positive THEN 1 ELSE 0 END) as flu_positive_count
-            FROM patients
-            GROUP BY hospital_id, admission_date
-            """
-            visits_df = pd.read_sql(query, conn)
+            visits_df = fetch_df(conn, SQL_DAILY_FLU_COUNTS)
             # Ensure date_key is datetime
-            visits_df['date_key'] = pd.to_datetime(visits_df['date_key'])
+            visits_df['date_key'] = pd.to_datetime(visits_df['date_key'], format='%Y-%m-%d')
 
-        hospitals_df = pd.read_sql("SELECT * FROM dim_hospital", conn)
+        hospitals_df = get_hospitals_df(conn)
         
         miner = OutbreakMiner(hospitals_df, visits_df)
-        dist_matrix = miner.compute_distance_matrix(metric=metric)
+        dist_matrix = get_distance_matrix(miner, hospitals_df, metric)
         clusters = miner.perform_clustering(dist_matrix, threshold=threshold)
         cluster_series = miner.calculate_cluster_series(clusters)
         edges = miner.predict_spread(cluster_series)
         
-        cluster_response = []
-        for cid, h_keys in clusters.items():
-            members = hospitals_df[hospitals_df['hospital_key'].isin(h_keys)][['hospital_id', 'name', 'latitude', 'longitude']].to_dict('records')
-            cluster_response.append({
-                "cluster_id": cid,
-                "members": members
-            })
+        cluster_response = build_cluster_response(clusters, hospitals_df)
             
-        return {
+        result = {
             "metric": metric,
             "clusters": cluster_response,
             "network": edges
         }
+        if len(SIMULATION_CACHE['results']) >= SIMULATION_CACHE['max_entries']:
+            SIMULATION_CACHE['results'] = {}
+        SIMULATION_CACHE['results'][(metric, threshold)] = result
+        return result
     except Exception as e:
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
     finally:
-        conn.close()
+        release_db_connection(conn)
 
 # Static Files Mount moved to end
 
@@ -781,6 +1119,9 @@ def run_simulation(metric: str = 'spatial', threshold: float = 0.05, role: str =
 MINING_CACHE = {
     'last_run': 0,
     'data': None,
+    'hid_to_cid': {}, # hospital_id -> cluster_id for the cached clusters
+    'cluster_counts': {}, # cluster_id -> flu-positive cases in its hospitals over the last 7 days
+    'alerts': {}, # hospital_id -> alert response, valid until the clusters expire
     'ttl': 300 # 5 minutes
 }
 
@@ -789,105 +1130,109 @@ def get_alerts(role: str = Depends(require_admin), user=Depends(get_current_user
     conn = get_db_connection()
     try:
         # 1. Get Admin's Hospital ID
-        cur = conn.execute("SELECT hospital_id FROM users WHERE username = ?", (user['sub'],))
-        row = cur.fetchone()
-        hid = row['hospital_id'] if row and row['hospital_id'] else None
+        hid = get_user_hospital_id(conn, user['sub'])
         
         if not hid:
             return {"alert": False, "message": "No hospital assigned."}
 
         # 2. Check Cache
-        import time
-        current_time = time.time()
+        current_time = time.monotonic()
         
         # If cache is fresh, use it to find MY cluster
         if MINING_CACHE['data'] and (current_time - MINING_CACHE['last_run'] < MINING_CACHE['ttl']):
             # print("Using Cached Mining Results")
+            cached_alert = MINING_CACHE['alerts'].get(hid)
+            if cached_alert is not None:
+                return cached_alert
             clusters = MINING_CACHE['data']
         else:
             # print("Running Fresh Mining...")
-            # 3. Get Data for Mining (Same as dashboard)
-            query = """
-            SELECT 
-                hospital_id as hospital_key, 
-                admission_date as date_key, 
-                SUM(CASE WHEN is_flu_positive THEN 1 ELSE 0 END) as flu_positive_count
-            FROM patients
-            GROUP BY hospital_id, admission_date
-            """
-            visits_df = pd.read_sql(query, conn)
+            # 3. Get Data for Mining (Same as dashboard, last 30 days)
+            visits_df = fetch_df(conn, SQL_RECENT_DAILY_FLU_COUNTS)
             
             if visits_df.empty:
                 return {"alert": False}
 
-            visits_df['date_key'] = pd.to_datetime(visits_df['date_key'])
-            hospitals_df = pd.read_sql("SELECT * FROM dim_hospital", conn)
-            # Ensure we use hospital_id as key
-            hospitals_df = hospitals_df.rename(columns={'hospital_id': 'hospital_key'}) 
+            visits_df['date_key'] = pd.to_datetime(visits_df['date_key'], format='%Y-%m-%d')
+            hospitals_df = get_hospitals_df(conn)
 
             # 4. Run Miner
             miner = OutbreakMiner(hospitals_df, visits_df)
-            dist_matrix = miner.compute_distance_matrix(metric='spatial') # Using spatial for consistency
-            clusters = miner.perform_clustering(dist_matrix, threshold=0.05)
+            dist_matrix = get_distance_matrix(miner, hospitals_df, 'spatial') # Using spatial for consistency
+            # Clusters come back keyed by the integer hospital_key; translate members to the
+            # text hospital_id that users, patients and the alert lookups use
+            id_by_key = dict(zip(hospitals_df['hospital_key'].tolist(), hospitals_df['hospital_id'].tolist()))
+            clusters = {
+                cid: [id_by_key[k] for k in h_keys]
+                for cid, h_keys in miner.perform_clustering(dist_matrix, threshold=0.05).items()
+            }
+            
+            # Recent cases for every cluster from one grouped read, instead of a query per alert
+            recent_by_hid = dict(conn.execute(SQL_RECENT_FLU_BY_HOSPITAL).fetchall())
             
-            # Update Cache
+            # Update Cache (alerts computed from the previous clusters go with them)
+            MINING_CACHE['hid_to_cid'] = {h: cid for cid, members in clusters.items() for h in members}
+            MINING_CACHE['cluster_counts'] = {cid: sum(recent_by_hid.get(h, 0) for h in members) for cid, members in clusters.items()}
+            MINING_CACHE['alerts'] = {}
             MINING_CACHE['data'] = clusters
             MINING_CACHE['last_run'] = current_time
 
         # 5. Find My Cluster
-        my_cluster_id = None
-        for cid, members in clusters.items():
-            if hid in members:
-                my_cluster_id = cid
-                break
+        my_cluster_id = MINING_CACHE['hid_to_cid'].get(hid)
         
         if my_cluster_id is None:
              return {"alert": False, "message": "Not in any cluster"}
 
-        # 6. Check Risk Level (Optimization: We need connection for this part if not cached, 
-        # but 'clusters' only gives IDs. We need case counts.
-        # Ideally we should cache the risk assessment too, but for now caching the heavy clustering is enough.)
-        
-        # Quick check of recent cases for THIS cluster
-        # This is fast enough to do on the fly usually.
-        
-        # To avoid re-querying DF, let's just do a specific SQL for the cluster members
+        # 6. Check Risk Level: recent case counts per cluster were gathered with the clusters.
+        # The resulting alert is cached per hospital alongside them.
         members = clusters[my_cluster_id]
         if not members: return {"alert": False}
         
-        placeholders = ','.join(['?'] * len(members))
-        query = f"""
-            SELECT COUNT(*) 
-            FROM patients 
-            WHERE hospital_id IN ({placeholders})
-            AND is_flu_positive = 1
-            AND admission_date >= date('now', '-7 days')
-        """
-        recent_cases = conn.execute(query, tuple(members)).fetchone()[0]
+        recent_cases = MINING_CACHE['cluster_counts'][my_cluster_id]
 
         if recent_cases > 5:
-            return {
+            alert = {
                 "alert": True, 
                 "cluster_id": int(my_cluster_id),
                 "risk_level": "High",
                 "message": f"High Risk: Your facility is in Active Cluster {my_cluster_id} ({recent_cases} recent cases in area)."
             }
+        else:
+            alert = {"alert": False, "message": "Monitoring - Low Risk"}
         
-        return {"alert": False, "message": "Monitoring - Low Risk"}
+        MINING_CACHE['alerts'][hid] = alert
+        return alert
 
     except Exception as e:
         print(f"Alert Error: {e}")
         return {"alert": False, "error": str(e)}
     finally:
-        conn.close()
+        release_db_connection(conn)
 
 # ... (omitted)
 
-from functools import lru_cache
+from cachetools import TTLCache
 
-@lru_cache(maxsize=100)
-def cached_search_request(q):
+# Geocoding results keep for a day: in memory, and in the nominatim_cache table so a restart
+# starts warm. Identical concurrent searches share one lock stripe, so only the first goes out
+# to Nominatim and the rest are served what it stored.
+NOMINATIM_TTL = 86400 # 1 day
+NOMINATIM_CACHE = TTLCache(maxsize=10000, ttl=NOMINATIM_TTL)
+NOMINATIM_CACHE_LOCK = threading.Lock() # TTLCache itself is not thread-safe
+NOMINATIM_LOCKS = [threading.Lock() for _ in range(64)]
+NOMINATIM_SESSION = {'session': None} # Reused for keep-alive across searches
+NOMINATIM_TIMEOUT = 5 # seconds; a stalled upstream must not hold a worker thread
+
+def fetch_nominatim(q):
     import requests
+    if NOMINATIM_SESSION['session'] is None:
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+        session = requests.Session()
+        # Pooled keep-alive connections; transient failures retried with backoff
+        session.mount('https://', HTTPAdapter(pool_connections=10, pool_maxsize=20,
+                                              max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 502, 503, 504])))
+        NOMINATIM_SESSION['session'] = session
     headers = {
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
         'Referer': 'http://localhost:3000/'
@@ -899,14 +1244,67 @@ def cached_search_request(q):
         'addressdetails': 1,
         'limit': 5
     }
-    resp = requests.get(url, params=params, headers=headers)
+    resp = NOMINATIM_SESSION['session'].get(url, params=params, headers=headers, timeout=NOMINATIM_TIMEOUT)
     resp.raise_for_status()
     return resp.json()
 
+# Persistence is best-effort (e.g. schema not yet applied): search still works without it
+def load_persisted_search(q):
+    conn = get_db_connection()
+    try:
+        row = conn.execute("SELECT response FROM nominatim_cache WHERE query = ? AND fetched_at > ?",
+                           (q, time.time() - NOMINATIM_TTL)).fetchone()
+        return orjson.loads(row['response']) if row else None
+    except sqlite3.OperationalError as e:
+        print(f"Nominatim cache read failed: {e}")
+        return None
+    finally:
+        release_db_connection(conn)
+
+def persist_search(q, result):
+    conn = get_db_connection()
+    try:
+        conn.execute("""
+            INSERT INTO nominatim_cache (query, response, fetched_at) VALUES (?, ?, ?)
+            ON CONFLICT(query) DO UPDATE SET response = excluded.response, fetched_at = excluded.fetched_at
+        """, (q, orjson.dumps(result).decode(), time.time()))
+        conn.commit()
+    except sqlite3.OperationalError as e:
+        print(f"Nominatim cache write failed: {e}")
+    finally:
+        release_db_connection(conn)
+
+def cached_search_request(q):
+    with NOMINATIM_CACHE_LOCK:
+        result = NOMINATIM_CACHE.get(q)
+    if result is not None:
+        return result
+    
+    with NOMINATIM_LOCKS[hash(q) % len(NOMINATIM_LOCKS)]:
+        # Another request may have fetched it while we waited
+        with NOMINATIM_CACHE_LOCK:
+            result = NOMINATIM_CACHE.get(q)
+        if result is not None:
+            return result
+        
+        result = load_persisted_search(q)
+        if result is None:
+            result = fetch_nominatim(q)
+            persist_search(q, result)
+        
+        with NOMINATIM_CACHE_LOCK:
+            NOMINATIM_CACHE[q] = result
+        return result
+
 @app.get("/api/hospital/search")
-def search_nominatim(q: str):
+async def search_nominatim(q: str):
+    # In-memory hits are answered on the event loop; misses (SQLite, HTTP) go to a worker thread
+    with NOMINATIM_CACHE_LOCK:
+        result = NOMINATIM_CACHE.get(q)
+    if result is not None:
+        return result
     try:
-        return cached_search_request(q)
+        return await run_in_threadpool(cached_search_request, q)
     except Exception as e:
         print(f"Nominatim Error: {e}")
         raise HTTPException(status_code=500, detail="Search failed")
@@ -1,6 +1,10 @@
-import pandas as pd
+import bisect
 import numpy as np
 
+# Occupancy bands: above 80% warns, above 90% is critical
+OCCUPANCY_THRESHOLDS = (0.80, 0.90)
+OCCUPANCY_LEVELS = (None, ("WARNING", "High Occupancy"), ("CRITICAL", "Critical Overcrowding"))
+
 class AlertEngine:
     def __init__(self, db_conn):
         self.conn = db_conn
@@ -11,33 +15,58 @@ class AlertEngine:
         Returns active alerts.
         """
         alerts = []
-        alerts.extend(self.check_capacity_stress())
-        alerts.extend(self.check_outbreak_velocity())
+        # Both checks read the same 7-day flu window, so it is queried once and shared
+        recent_flu = self.fetch_recent_flu()
+        alerts.extend(self.check_capacity_stress(recent_flu))
+        alerts.extend(self.check_outbreak_velocity(recent_flu))
         
         self.persist_alerts(alerts)
         return alerts
 
-    def check_capacity_stress(self):
+    def fetch_recent_flu(self):
+        """
+        Flu-positive admissions in the last 7 days as (hospital_id, admission_date, count)
+        rows, ordered by date. Served from the (is_flu_positive, admission_date, hospital_id) index.
+        """
+        return self.conn.execute("""
+            SELECT hospital_id, admission_date, COUNT(*)
+            FROM patients
+            WHERE is_flu_positive = 1
+            AND admission_date >= date('now', '-7 days')
+            GROUP BY admission_date, hospital_id
+            ORDER BY admission_date
+        """).fetchall()
+
+    def check_capacity_stress(self, recent_flu=None):
         """
         Check for hospitals exceeding safe resource limits.
         """
         generated_alerts = []
         
+        if recent_flu is None:
+            recent_flu = self.fetch_recent_flu()
+        flu_by_hospital = {}
+        for hospital_id, _, cnt in recent_flu:
+            flu_by_hospital[hospital_id] = flu_by_hospital.get(hospital_id, 0) + cnt
+        
         query = """
             SELECT 
                 h.hospital_id, h.name, 
                 h.icu_beds, h.total_beds,
-                h.occupied_beds, 
+                h.occupied_beds
                 -- We use the columns added in Phase 8 for live capacity if updated via API,
                 -- but we also need to consider the 'in_use' columns if we were using the fact table for simulation.
                 -- For the 'Real World' app, let's rely on the dim_hospital live values updated by Admin 
                 -- OR the estimated usage from patient counts if manual data isn't fresh.
-                (SELECT COUNT(*) FROM patients p WHERE p.hospital_id = h.hospital_id AND p.is_flu_positive=1 AND p.admission_date >= date('now', '-7 days')) as recent_flu
             FROM dim_hospital h
+            ORDER BY h.hospital_key
         """
-        df = pd.read_sql(query, self.conn)
+        # Plain row tuples: no DataFrame build or per-row Series boxing for a single pass
+        rows = self.conn.execute(query).fetchall()
         
-        for _, row in df.iterrows():
+        for hospital_id, name, icu_beds, total_beds, occupied_beds in rows:
+            recent_flu_count = flu_by_hospital.get(hospital_id, 0)
+
             # Estimate ICU usage if live data missing (same logic as dashboard)
             # But let's assume the 'occupied_beds' column is the source of truth for General beds
             # For ICU, we lack a direct column in dim_hospital unless we added it?
@@ -49,58 +78,53 @@ class AlertEngine:
             # ICU Load = 10% of total occupied + 15% of recent flu cases?
             # Or just use the General Occupancy for now.
             
+            if not total_beds or total_beds <= 0:
+                continue # No capacity on record (NULL or 0)
+            
             # 1. General Capacity Check
-            if row['total_beds'] > 0:
-                occ_rate = row['occupied_beds'] / row['total_beds']
-                if occ_rate > 0.90:
+            if occupied_beds is not None:
+                occ_rate = occupied_beds / total_beds
+                level = OCCUPANCY_LEVELS[bisect.bisect_left(OCCUPANCY_THRESHOLDS, occ_rate)]
+                if level:
+                    severity, label = level
                     generated_alerts.append({
-                        "hospital_id": row['hospital_id'],
-                        "severity": "CRITICAL",
-                        "message": f"Critical Overcrowding: {row['name']} at {int(occ_rate*100)}% capacity."
-                    })
-                elif occ_rate > 0.80:
-                    generated_alerts.append({
-                        "hospital_id": row['hospital_id'],
-                        "severity": "WARNING",
-                        "message": f"High Occupancy: {row['name']} at {int(occ_rate*100)}% capacity."
+                        "hospital_id": hospital_id,
+                        "severity": severity,
+                        "message": f"{label}: {name} at {int(occ_rate*100)}% capacity."
                     })
             
             # 2. Flu Spike Check (Proxy for ICU stress)
             # If recent flu cases > 20% of total beds -> Critical Risk
-            if row['total_beds'] > 0:
-                flu_load = row['recent_flu'] / row['total_beds']
-                if flu_load > 0.20:
-                     generated_alerts.append({
-                        "hospital_id": row['hospital_id'],
-                        "severity": "CRITICAL",
-                        "message": f"surge Detected: Flu patients occupy >20% of capacity at {row['name']}."
-                    })
+            flu_load = recent_flu_count / total_beds
+            if flu_load > 0.20:
+                 generated_alerts.append({
+                    "hospital_id": hospital_id,
+                    "severity": "CRITICAL",
+                    "message": f"surge Detected: Flu patients occupy >20% of capacity at {name}."
+                })
 
         return generated_alerts
 
-    def check_outbreak_velocity(self):
+    def check_outbreak_velocity(self, recent_flu=None):
         """
         Check if infection rate is doubling rapidly across the system.
         """
         alerts = []
         
-        # Get daily counts for last 7 days
-        query = """
-            SELECT admission_date, COUNT(*) as cnt 
-            FROM patients 
-            WHERE is_flu_positive = 1 
-            AND admission_date >= date('now', '-7 days')
-            GROUP BY admission_date
-            ORDER BY admission_date
-        """
-        df = pd.read_sql(query, self.conn)
+        # Daily counts for last 7 days (rows arrive in date order)
+        if recent_flu is None:
+            recent_flu = self.fetch_recent_flu()
+        counts_by_date = {}
+        for _, admission_date, cnt in recent_flu:
+            counts_by_date[admission_date] = counts_by_date.get(admission_date, 0) + cnt
+        daily_counts = list(counts_by_date.values())
         
-        if len(df) < 3: return []
+        if len(daily_counts) < 3: return []
         
         # Simple slope check
         # If today's count > 2 * count 3 days ago
-        latest = df.iloc[-1]['cnt']
-        past = df.iloc[0]['cnt'] # approx 7 days ago
+        latest = daily_counts[-1]
+        past = daily_counts[0] # approx 7 days ago
         
         if latest > past * 2 and latest > 10:
              alerts.append({
@@ -116,19 +140,23 @@ class AlertEngine:
         Save to DB if not duplicate (simple de-dupe logic: same hospital, same message, same day).
         """
         cursor = self.conn.cursor()
+        # Load today's (hospital, message) pairs once instead of probing per alert
+        seen = {tuple(row) for row in cursor.execute("""
+            SELECT hospital_id, message FROM alerts
+            WHERE created_at >= date('now') AND created_at < date('now', '+1 day')
+        """)}
+        
+        rows = []
         for alert in new_alerts:
-            # Check exist
-            exists = cursor.execute("""
-                SELECT 1 FROM alerts 
-                WHERE (hospital_id = ? OR (hospital_id IS NULL AND ? IS NULL))
-                AND message = ? 
-                AND date(created_at) = date('now')
-            """, (alert['hospital_id'], alert['hospital_id'], alert['message'])).fetchone()
-            
-            if not exists:
-                cursor.execute("""
-                    INSERT INTO alerts (hospital_id, severity, message)
-                    VALUES (?, ?, ?)
-                """, (alert['hospital_id'], alert['severity'], alert['message']))
+            key = (alert['hospital_id'], alert['message'])
+            if key not in seen:
+                seen.add(key) # Also de-dupes repeats within this batch
+                rows.append((alert['hospital_id'], alert['severity'], alert['message']))
+        
+        if rows:
+            cursor.executemany("""
+                INSERT INTO alerts (hospital_id, severity, message)
+                VALUES (?, ?, ?)
+            """, rows)
         
         self.conn.commit()
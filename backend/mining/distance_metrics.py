@@ -1,8 +1,9 @@
 import numpy as np
-from scipy.spatial.distance import euclidean
-from scipy.stats import pearsonr
-import statsmodels.api as sm
-from fastdtw import fastdtw
+from scipy.fft import next_fast_len
+from scipy.spatial.distance import euclidean, pdist, squareform
+
+# scipy.stats and fastdtw are heavy to import and only needed by the per-pair
+# temporal metrics, so they are imported inside those methods on first use.
 
 class DistanceMetrics:
     """Implementations of distance measures from the paper."""
@@ -15,11 +16,25 @@ class DistanceMetrics:
         """
         return euclidean(coord1, coord2)
 
+    @staticmethod
+    def spatial_distance_matrix(lat, lon):
+        """
+        Pairwise spatial_distance for coordinates given as separate lat/lon arrays.
+        Returns the symmetric NxN float64 matrix with a zero diagonal.
+        """
+        dlat = lat[:, np.newaxis] - lat[np.newaxis, :]
+        dlon = lon[:, np.newaxis] - lon[np.newaxis, :]
+        dist_matrix = np.hypot(dlat, dlon).astype(np.float64)
+        np.fill_diagonal(dist_matrix, 0)
+        return dist_matrix
+
     @staticmethod
     def temporal_correlation(series1, series2):
         """
         Correlation-based distance: sqrt(2 * (1 - PearsonCorr))
         """
+        from scipy.stats import pearsonr
+        
         # Pearson returns (corr, p-value)
         corr, _ = pearsonr(series1, series2)
         # Handle cases where correlation is NaN (e.g., constant series)
@@ -27,12 +42,28 @@ class DistanceMetrics:
             corr = 0
         return np.sqrt(2 * (1 - corr))
 
+    @staticmethod
+    def temporal_correlation_matrix(series):
+        """
+        temporal_correlation for every pair of rows in an (N, T) array, from one
+        correlation matrix. Returns the symmetric NxN matrix with a zero diagonal.
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            corr = np.atleast_2d(np.corrcoef(series))
+        corr[np.isnan(corr)] = 0 # Constant series
+        corr = np.triu(corr) + np.triu(corr, 1).T # Mirror so the result is exactly symmetric
+        dist_matrix = np.sqrt(2 * (1 - corr))
+        np.fill_diagonal(dist_matrix, 0)
+        return dist_matrix
+
     @staticmethod
     def temporal_dtw(series1, series2):
         """
         Dynamic Time Warping distance.
         Uses fastdtw for efficiency.
         """
+        from fastdtw import fastdtw
+        
         # fastdtw expects 1-D arrays for univariate time series
         # We reshape to (-1, 1) so that fastdtw passes (1,) vectors to euclidean
         # instead of scalars, preventing "Input vector should be 1-D" error.
@@ -45,6 +76,27 @@ class DistanceMetrics:
         distance, path = fastdtw(s1, s2, dist=euclidean)
         return distance
 
+    @staticmethod
+    def autocorrelation(series, nlags):
+        """
+        Sample ACF up to nlags for each row of an (N, T) array, using the same
+        estimator as statsmodels' acf(fft=True) but one batched FFT for all rows.
+        Constant series have no defined ACF and return all zeros.
+        """
+        series = np.atleast_2d(np.asarray(series, dtype=np.float64))
+        n_obs = series.shape[1]
+        centered = series - series.mean(axis=1, keepdims=True)
+        
+        size = next_fast_len(2 * n_obs + 1)
+        spectrum = np.fft.rfft(centered, n=size, axis=1)
+        acov = np.fft.irfft(spectrum * np.conj(spectrum), n=size, axis=1)[:, :nlags + 1]
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            acf = acov / acov[:, :1]
+        acf[np.ptp(series, axis=1) == 0] = 0 # Zero variance (e.g., constant series)
+        acf[~np.isfinite(acf)] = 0
+        return acf
+
     @staticmethod
     def temporal_acf(series1, series2, lags=None):
         """
@@ -54,11 +106,23 @@ class DistanceMetrics:
         if lags is None:
             lags = min(len(series1), len(series2)) // 2
             
-        acf1 = sm.tsa.acf(series1, nlags=lags, fft=True)
-        acf2 = sm.tsa.acf(series2, nlags=lags, fft=True)
+        acf1 = DistanceMetrics.autocorrelation(series1, lags)[0]
+        acf2 = DistanceMetrics.autocorrelation(series2, lags)[0]
         
         return euclidean(acf1, acf2)
 
+    @staticmethod
+    def temporal_acf_matrix(series):
+        """
+        temporal_acf for every pair of rows in an (N, T) array. Each row's ACF is
+        computed once instead of once per pair. Returns the symmetric NxN matrix.
+        """
+        n = len(series)
+        if n < 2:
+            return np.zeros((n, n))
+        acfs = DistanceMetrics.autocorrelation(series, series.shape[1] // 2)
+        return squareform(pdist(acfs, 'euclidean'))
+
     @staticmethod
     def temporal_euclidean(series1, series2):
         """Standard Euclidean distance between time series."""
@@ -69,3 +133,14 @@ class DistanceMetrics:
             series2 = series2[:min_len]
             
         return euclidean(series1, series2)
+
+    @staticmethod
+    def temporal_euclidean_matrix(series):
+        """
+        temporal_euclidean for every pair of rows in an (N, T) array in one
+        compiled pdist pass. Returns the symmetric NxN matrix.
+        """
+        n = len(series)
+        if n < 2:
+            return np.zeros((n, n))
+        return squareform(pdist(series, 'euclidean'))
@@ -2,8 +2,8 @@ import numpy as np
 import pandas as pd
 from scipy.cluster.hierarchy import linkage, fcluster
 from scipy.spatial.distance import squareform
+from scipy.sparse.csgraph import connected_components
 from .distance_metrics import DistanceMetrics
-from statsmodels.tsa.holtwinters import ExponentialSmoothing
 
 class OutbreakMiner:
     def __init__(self, hospitals_df, visits_df):
@@ -12,6 +12,16 @@ class OutbreakMiner:
         visits_df: DataFrame with ['hospital_key', 'date_key', 'flu_positive_count']
         """
         self.hospitals = hospitals_df
+        
+        # Coordinates as contiguous float32 lat/lon columns (SoA). They are stored as
+        # offsets from the bounding-box centre so the narrow dtype keeps sub-metre precision.
+        coords = self.hospitals[['latitude', 'longitude']].to_numpy(dtype=np.float64)
+        if len(coords):
+            origin = np.nan_to_num((np.fmin.reduce(coords, axis=0) + np.fmax.reduce(coords, axis=0)) / 2)
+        else:
+            origin = np.zeros(2)
+        self.lat, self.lon = np.ascontiguousarray((coords - origin).T, dtype=np.float32)
+        
         # Pivot visits to get time series matrix: Rows=Date, Cols=Hospital
         self.time_series = visits_df.pivot(index='date_key', columns='hospital_key', values='flu_positive_count').fillna(0)
         
@@ -20,11 +30,19 @@ class OutbreakMiner:
         self.time_series = self.time_series.reindex(columns=all_keys, fill_value=0)
         
         # Normalize time series (Zero mean, Unit variance) as per paper
-        std = self.time_series.std()
-        std = std.fillna(1) # Handle NaNs (e.g. single data point)
-        std = std.replace(0, 1) # Avoid division by zero for constant series
-        self.normalized_ts = (self.time_series - self.time_series.mean()) / std
-        self.normalized_ts = self.normalized_ts.fillna(0) # Handle remaining edge cases
+        # Single NumPy pass over the matrix: one mean, one centered sum of squares
+        values = self.time_series.to_numpy(dtype=np.float64)
+        n_obs = values.shape[0]
+        mean = values.sum(axis=0) / n_obs if n_obs else np.zeros(values.shape[1])
+        centered = values - mean
+        if n_obs > 1:
+            std = np.sqrt(np.einsum('ij,ij->j', centered, centered) / (n_obs - 1))
+        else:
+            std = np.ones(values.shape[1]) # Single data point has no spread
+        std[~np.isfinite(std) | (std == 0)] = 1 # Avoid division by zero for constant series
+        normalized = centered / std
+        normalized[np.isnan(normalized)] = 0 # Handle remaining edge cases
+        self.normalized_ts = pd.DataFrame(normalized, index=self.time_series.index, columns=self.time_series.columns)
 
     def predict_hospital_visits(self, hospital_id, horizon=7):
         """
@@ -47,6 +65,9 @@ class OutbreakMiner:
                      result.append({'date': next_date, 'predicted': max(0, mean_val)})
                  return result
 
+            # Imported lazily: statsmodels adds ~1s to API startup and only forecasts need it
+            from statsmodels.tsa.holtwinters import ExponentialSmoothing
+            
             # Fit Holt-Winters (Exponential Smoothing) with trend
             # Use 'add' trend if possible, fallback to simple if data is sparse
             model = ExponentialSmoothing(series.astype(float), trend='add', seasonal=None).fit()
@@ -69,34 +90,34 @@ class OutbreakMiner:
         Compute NxN distance matrix for hospitals.
         Metric: 'spatial', 'dtw', 'cor', 'acf'
         """
-        keys = self.hospitals['hospital_key'].values
-        n = len(keys)
+        if metric == 'spatial':
+            # Euclidean (lat, lon) distance for all pairs in one broadcasted pass
+            return DistanceMetrics.spatial_distance_matrix(self.lat, self.lon)
+        
+        # One contiguous row per hospital (columns are already in hospital order),
+        # so each pair reads two cache-friendly slices instead of two DataFrame lookups
+        series = np.ascontiguousarray(self.normalized_ts.to_numpy(dtype=np.float64).T)
+        n = len(series)
+        
+        if metric == 'cor':
+            # Pearson distance for all pairs from a single correlation matrix
+            return DistanceMetrics.temporal_correlation_matrix(series)
+        if metric == 'acf':
+            # ACF of each hospital computed once, then compared pairwise
+            return DistanceMetrics.temporal_acf_matrix(series)
+        if metric != 'dtw':
+            # Plain Euclidean over all pairs in one batched call
+            return DistanceMetrics.temporal_euclidean_matrix(series)
+        
         dist_matrix = np.zeros((n, n))
         
-        # Use simple loops for clarity, optimize later if needed
+        # DTW has no batched form, so it is still computed pair by pair
         for i in range(n):
             for j in range(i + 1, n):
-                h1 = keys[i]
-                h2 = keys[j]
+                ts1 = series[i]
+                ts2 = series[j]
                 
-                if metric == 'spatial':
-                    row1 = self.hospitals[self.hospitals['hospital_key'] == h1].iloc[0]
-                    row2 = self.hospitals[self.hospitals['hospital_key'] == h2].iloc[0]
-                    c1 = (row1['latitude'], row1['longitude'])
-                    c2 = (row2['latitude'], row2['longitude'])
-                    d = DistanceMetrics.spatial_distance(c1, c2)
-                else:
-                    ts1 = self.normalized_ts[h1].values
-                    ts2 = self.normalized_ts[h2].values
-                    
-                    if metric == 'dtw':
-                        d = DistanceMetrics.temporal_dtw(ts1, ts2)
-                    elif metric == 'cor':
-                        d = DistanceMetrics.temporal_correlation(ts1, ts2)
-                    elif metric == 'acf':
-                        d = DistanceMetrics.temporal_acf(ts1, ts2)
-                    else:
-                        d = DistanceMetrics.temporal_euclidean(ts1, ts2)
+                d = DistanceMetrics.temporal_dtw(ts1, ts2)
                 
                 dist_matrix[i, j] = d
                 dist_matrix[j, i] = d
@@ -108,14 +129,31 @@ class OutbreakMiner:
         Hierarchical clustering using calculating linkage.
         Returns dictionary mapping cluster_id -> list of hospital_keys.
         """
-        # Condensed distance matrix for scipy
-        condensed_dist = squareform(dist_matrix)
+        # Hospitals not linked by any chain of pairs within the threshold can never
+        # share an average-linkage cluster below it, so split into connected
+        # components first and only build the linkage tree inside each one.
+        n_components, component_of = connected_components(dist_matrix <= threshold, directed=False)
         
-        # Average linkage as implied by paper Eq 1
-        Z = linkage(condensed_dist, method='average')
-        
-        # Cut tree by distance threshold (e.g. 0.05 degrees ~ 5.5km)
-        labels = fcluster(Z, t=threshold, criterion='distance')
+        labels = np.empty(len(dist_matrix), dtype=int)
+        next_label = 1
+        for component in range(n_components):
+            members = np.flatnonzero(component_of == component)
+            if len(members) <= 2:
+                # Singletons stay alone; a connected pair is within threshold by definition
+                labels[members] = next_label
+                next_label += 1
+                continue
+            
+            # Condensed distance matrix for scipy
+            condensed_dist = squareform(dist_matrix[np.ix_(members, members)])
+            
+            # Average linkage as implied by paper Eq 1
+            Z = linkage(condensed_dist, method='average')
+            
+            # Cut tree by distance threshold (e.g. 0.05 degrees ~ 5.5km)
+            sub_labels = fcluster(Z, t=threshold, criterion='distance')
+            labels[members] = sub_labels + (next_label - 1)
+            next_label += int(sub_labels.max())
         
         clusters = {}
         keys = self.hospitals['hospital_key'].values
@@ -147,6 +185,29 @@ class OutbreakMiner:
         clusters = cluster_series.columns
         edges = []
         
+        values = cluster_series.to_numpy(dtype=np.float64)
+        n = len(values)
+        lags = np.arange(-max_lag, max_lag + 1)
+        
+        # Cross Correlation function
+        # We want to find lag 'l' where s1(t+l) ~ s2(t)
+        # If l > 0, s1 leads s2 (s1 happens first)
+        # Once the date index is aligned, lag l and -l both compare the series over
+        # the same dates [|l|, n - |l|), so build one correlation matrix per window
+        # and share it across every cluster pair instead of correlating pair by pair.
+        window_corr = np.zeros((max_lag + 1, len(clusters), len(clusters)))
+        for w in range(max_lag + 1):
+            window = values[w:n - w]
+            if len(window) < 2 or len(clusters) < 2:
+                continue # Undefined correlation counts as 0
+            with np.errstate(divide='ignore', invalid='ignore'):
+                c = np.corrcoef(window, rowvar=False)
+            c[np.isnan(c)] = 0 # Constant series
+            window_corr[w] = c
+        
+        lag_corrs = window_corr[np.abs(lags)] # (lag, cluster, cluster)
+        best_indices = lag_corrs.argmax(axis=0)
+        
         for i in range(len(clusters)):
             for j in range(len(clusters)):
                 if i == j: continue
@@ -154,29 +215,10 @@ class OutbreakMiner:
                 c1 = clusters[i]
                 c2 = clusters[j]
                 
-                s1 = cluster_series[c1]
-                s2 = cluster_series[c2]
-                
-                # Cross Correlation function
-                # We want to find lag 'l' where s1(t+l) ~ s2(t)
-                # If l > 0, s1 leads s2 (s1 happens first)
-                
-                corrs = []
-                lags = range(-max_lag, max_lag + 1)
-                for l in lags:
-                    if l < 0:
-                        # s1 shifted back
-                        c = s1.iloc[:l].corr(s2.iloc[-l:]) # Alignment might be tricky, using numpy cross corr is safer
-                    elif l > 0:
-                        c = s1.iloc[l:].corr(s2.iloc[:-l])
-                    else:
-                        c = s1.corr(s2)
-                    corrs.append(c if not np.isnan(c) else 0)
-                
                 # Find optimal lag (Magnitude)
-                best_idx = np.argmax(corrs)
-                best_lag = lags[best_idx]
-                max_corr = corrs[best_idx]
+                best_idx = best_indices[i, j]
+                best_lag = int(lags[best_idx])
+                max_corr = lag_corrs[best_idx, i, j]
                 
                 # Equation 17-19 (Momentum) - Simplified logic
                 # If best_lag > 0 (s1 needs to be shifted forward to match s2), s2 is AHEAD of s1?
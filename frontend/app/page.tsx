@@ -76,7 +76,12 @@ export default function Dashboard() {
         fetch(`${API_URL}/api/public/history`)
             .then(res => res.json())
             .then(data => {
-                setHistory(data)
+                // Rows arrive as [hospital_id, lat, lon, count] arrays
+                const byDate: any = {}
+                for (const [date, rows] of Object.entries(data as Record<string, any[]>)) {
+                    byDate[date] = rows.map(([hospital_id, lat, lon, count]) => ({ hospital_id, lat, lon, count }))
+                }
+                setHistory(byDate)
                 const sortedDates = Object.keys(data).sort()
                 setDates(sortedDates)
                 setSliderIndex(sortedDates.length - 1)
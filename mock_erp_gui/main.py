@@ -7,8 +7,19 @@ import random
 import time
 import uuid
 import asyncio
+from contextlib import asynccontextmanager
 
-app = FastAPI()
+# One pooled client for the app's lifetime, so repeated admissions reuse
+# keep-alive connections to the platform instead of a new client per request
+ERP_CLIENT_LIMITS = httpx.Limits(max_connections=20, max_keepalive_connections=10)
+http_client = httpx.AsyncClient(limits=ERP_CLIENT_LIMITS, timeout=5.0)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await http_client.aclose()
+
+app = FastAPI(lifespan=lifespan)
 
 # Mount static files (our UI)
 app.mount("/static", StaticFiles(directory="mock_erp_gui/static"), name="static")
@@ -51,15 +62,14 @@ async def admit_patient(req: AdmissionRequest):
     
     print(f"Sending to {req.target_url}: {payload}")
     
-    async with httpx.AsyncClient() as client:
-        try:
-            resp = await client.post(req.target_url, json=payload, timeout=5.0)
-            if resp.status_code == 200:
-                return {"status": "success", "data_sent": patient_data, "response": resp.json()}
-            else:
-                return {"status": "error", "code": resp.status_code, "detail": resp.text}
-        except Exception as e:
-            return {"status": "error", "detail": str(e)}
+    try:
+        resp = await http_client.post(req.target_url, json=payload)
+        if resp.status_code == 200:
+            return {"status": "success", "data_sent": patient_data, "response": resp.json()}
+        else:
+            return {"status": "error", "code": resp.status_code, "detail": resp.text}
+    except Exception as e:
+        return {"status": "error", "detail": str(e)}
 
 # Auto-generation state (simplistic global state for demo)
 is_running = False
@@ -1,5 +1,5 @@
 import sqlite3
-import random
+import numpy as np
 from datetime import datetime, timedelta
 import os
 
@@ -15,6 +15,29 @@ def get_db():
     conn.execute("PRAGMA journal_mode=WAL;")
     return conn
 
+# SQLite's default bound-parameter limit on older builds (SQLITE_MAX_VARIABLE_NUMBER)
+SQLITE_MAX_VARIABLES = 999
+
+def insert_rows(cur, table, columns, rows, conflict_clause=""):
+    """
+    Insert rows as multi-row VALUES statements, batched under the parameter limit.
+    conflict_clause is appended to each statement (e.g. an ON CONFLICT ... DO NOTHING).
+    Returns the number of rows actually inserted.
+    """
+    inserted = 0
+    if not rows:
+        return inserted
+    placeholder = "(" + ", ".join(["?"] * len(columns)) + ")"
+    batch_size = SQLITE_MAX_VARIABLES // len(columns)
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        cur.execute(
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES " + ", ".join([placeholder] * len(batch)) + conflict_clause,
+            [value for row in batch for value in row]
+        )
+        inserted += cur.rowcount
+    return inserted
+
 def populate_hospitals(conn):
     print("Populating Hospitals...")
     hospitals = [
@@ -26,18 +49,12 @@ def populate_hospitals(conn):
     ]
     
     cur = conn.cursor()
-    count = 0
-    for hid, name, lat, lon, city, region in hospitals:
-        # Check if exists
-        exists = cur.execute("SELECT 1 FROM dim_hospital WHERE hospital_id = ?", (hid,)).fetchone()
-        if not exists:
-            cur.execute("""
-                INSERT INTO dim_hospital (hospital_id, name, latitude, longitude, city, region, total_beds, icu_beds)
-                VALUES (?, ?, ?, ?, ?, ?, 200, 40)
-            """, (hid, name, lat, lon, city, region))
-            count += 1
-    conn.commit()
-    print(f"  Added {count} new hospitals.")
+    # Idempotent insert: existing hospital_ids are skipped by the unique constraint itself,
+    # so there is no separate existence check to race against
+    rows = [(hid, name, lat, lon, city, region, 200, 40) for hid, name, lat, lon, city, region in hospitals]
+    added = insert_rows(cur, "dim_hospital", ["hospital_id", "name", "latitude", "longitude", "city", "region", "total_beds", "icu_beds"], rows,
+                        conflict_clause=" ON CONFLICT(hospital_id) DO NOTHING")
+    print(f"  Added {added} new hospitals.")
     return [h[0] for h in hospitals]
 
 def populate_patients(conn, hospital_ids):
@@ -45,36 +62,37 @@ def populate_patients(conn, hospital_ids):
     # Generate data for last 30 days
     end_date = datetime.now()
     start_date = end_date - timedelta(days=30)
+    # Format each day in the window once instead of per generated record
+    date_strings = [(start_date + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(31)]
     
     cur = conn.cursor()
-    total_added = 0
+    n_records = 500 # Generate 500 records
+    rng = np.random.default_rng()
     
-    for _ in range(500): # Generate 500 records
-        # Random date
-        days_offset = random.randint(0, 30)
-        record_date = (start_date + timedelta(days=days_offset)).strftime("%Y-%m-%d")
-        
-        # Random Hospital
-        visiting_hospital = random.choice(hospital_ids)
-        
-        # Flu Logic: Clustered outbreak logic (simplified)
-        # Higher chance of flu in 'Cluster' hospitals (H001, H002)
-        is_flu = False
-        rand_val = random.random()
-        
-        if visiting_hospital in ['H001', 'H002']:
-            if rand_val < 0.4: is_flu = True # 40% chance
-        else:
-            if rand_val < 0.1: is_flu = True # 10% chance
-            
-        cur.execute("""
-            INSERT INTO patients (hospital_id, admission_date, age, gender, is_flu_positive, status)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (visiting_hospital, record_date, random.randint(18, 90), random.choice(['M', 'F']), is_flu, 'Admitted'))
-        total_added += 1
-        
-    conn.commit()
-    print(f"  Added {total_added} patient records.")
+    # Draw every column for all records at once instead of per record
+    days_offset = rng.integers(0, 31, size=n_records) # Random date
+    visiting_hospital = rng.choice(hospital_ids, size=n_records) # Random Hospital
+    
+    # Flu Logic: Clustered outbreak logic (simplified)
+    # Higher chance of flu in 'Cluster' hospitals (H001, H002): 40% vs 10% elsewhere
+    flu_chance = np.where(np.isin(visiting_hospital, ['H001', 'H002']), 0.4, 0.1)
+    is_flu = rng.random(n_records) < flu_chance
+    
+    ages = rng.integers(18, 91, size=n_records)
+    genders = rng.choice(['M', 'F'], size=n_records)
+    
+    rows = list(zip(
+        visiting_hospital.tolist(),
+        [date_strings[d] for d in days_offset.tolist()],
+        ages.tolist(),
+        genders.tolist(),
+        is_flu.tolist(),
+        ['Admitted'] * n_records
+    ))
+    
+    # Multi-row VALUES batches instead of a statement per generated record
+    insert_rows(cur, "patients", ["hospital_id", "admission_date", "age", "gender", "is_flu_positive", "status"], rows)
+    print(f"  Added {len(rows)} patient records.")
 
 def main():
     try:
@@ -87,8 +105,11 @@ def main():
             print("Tables not found. Please run 'setup_database.py' first.")
             return
 
-        h_ids = populate_hospitals(conn)
-        populate_patients(conn, h_ids)
+        # One transaction for the whole seed: a single commit (one WAL sync), and a
+        # failure part-way leaves no half-populated demo data behind
+        with conn:
+            h_ids = populate_hospitals(conn)
+            populate_patients(conn, h_ids)
         
         print("\nDemo Data Population Complete!")
         conn.close()
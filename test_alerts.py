@@ -0,0 +1,85 @@
+import os
+import queue
+import sqlite3
+import sys
+import tempfile
+from datetime import date, timedelta
+
+# Runs the API in-process (TestClient) against a throwaway database, so no server is needed
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend")
+sys.path.insert(0, BACKEND_DIR)
+
+import auth
+import main
+from fastapi.testclient import TestClient
+
+def build_db(path):
+    conn = sqlite3.connect(path)
+    with open(os.path.join(BACKEND_DIR, "database", "schema.sql")) as f:
+        conn.executescript(f.read())
+    # H001/H002 sit ~1km apart (one cluster); H003 is far away on its own
+    conn.executemany(
+        "INSERT INTO dim_hospital (hospital_id, name, latitude, longitude, city, region) VALUES (?, ?, ?, ?, 'Toronto', 'Ontario')",
+        [("H001", "Toronto General", 43.6596, -79.3884), ("H002", "Mount Sinai", 43.6573, -79.3903), ("H003", "Far Away", 45.0, -75.0)]
+    )
+    today = date.today()
+    patients = [("H001", (today - timedelta(days=d % 5)).isoformat(), 1) for d in range(4)]
+    patients += [("H002", (today - timedelta(days=d % 5)).isoformat(), 1) for d in range(4)]
+    patients += [("H003", today.isoformat(), 1), ("H003", today.isoformat(), 0)]
+    conn.executemany("INSERT INTO patients (hospital_id, admission_date, is_flu_positive) VALUES (?, ?, ?)", patients)
+    conn.executemany("INSERT INTO users (username, password_hash, role, hospital_id) VALUES (?, 'x', 'admin', ?)",
+                     [("near_admin", "H001"), ("far_admin", "H003")])
+    conn.commit()
+    conn.close()
+
+def get_alert(client, username):
+    token = auth.create_access_token(data={"sub": username, "role": "admin"})
+    res = client.get("/api/hospital/alerts", headers={"Authorization": f"Bearer {token}"})
+    assert res.status_code == 200, res.text
+    return res.json()
+
+# Module state the test swaps out; restored afterwards so later users of `main` are unaffected
+PATCHED_GLOBALS = ("DB_PATH", "DB_POOL", "MINING_CACHE", "HOSPITALS_CACHE", "SPATIAL_DISTANCE_CACHE", "USER_HOSPITAL_CACHE")
+
+def test_alerts():
+    saved = {name: getattr(main, name) for name in PATCHED_GLOBALS}
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            main.DB_PATH = os.path.join(tmp, "warehouse.db")
+            build_db(main.DB_PATH)
+            # Own pool and empty caches, so nothing from the real warehouse leaks in or out
+            main.DB_POOL = queue.LifoQueue(maxsize=main.DB_POOL_SIZE)
+            main.MINING_CACHE = {**saved["MINING_CACHE"], 'last_run': 0, 'data': None, 'hid_to_cid': {}, 'cluster_counts': {}, 'alerts': {}}
+            main.HOSPITALS_CACHE = {**saved["HOSPITALS_CACHE"], 'entry': None}
+            main.SPATIAL_DISTANCE_CACHE = {**saved["SPATIAL_DISTANCE_CACHE"], 'entry': None}
+            main.USER_HOSPITAL_CACHE = {**saved["USER_HOSPITAL_CACHE"], 'entries': {}}
+            client = TestClient(main.app)
+
+            # 8 recent cases across the H001/H002 cluster crosses the alert threshold (> 5)
+            alert = get_alert(client, "near_admin")
+            assert "error" not in alert, alert
+            assert alert["alert"] is True
+            assert alert["risk_level"] == "High"
+            assert "8 recent cases" in alert["message"]
+            assert main.MINING_CACHE['hid_to_cid']["H001"] == main.MINING_CACHE['hid_to_cid']["H002"] == alert["cluster_id"]
+            # Recent counts are gathered per cluster once per mining run
+            assert main.MINING_CACHE['cluster_counts'][alert["cluster_id"]] == 8
+            assert main.MINING_CACHE['cluster_counts'][main.MINING_CACHE['hid_to_cid']["H003"]] == 1
+
+            # Isolated hospital with a single recent case: monitored, no alert
+            far = get_alert(client, "far_admin")
+            assert far == {"alert": False, "message": "Monitoring - Low Risk"}
+
+            # Served from the per-hospital cache on the next call
+            assert main.MINING_CACHE['alerts']["H001"] == alert
+            assert get_alert(client, "near_admin") == alert
+        finally:
+            # Close the test pool's connections before the temp database goes away
+            while not main.DB_POOL.empty():
+                main.DB_POOL.get_nowait().close()
+            for name, value in saved.items():
+                setattr(main, name, value)
+
+if __name__ == "__main__":
+    test_alerts()
+    print("OK")